@@ -0,0 +1,84 @@
+"""
+Crawler throughput benchmark for rag_setup.
+
+Serves a local copy of the Manim docs (a directory containing reference.html and
+the reference/ pages, e.g. from `wget --mirror` or a Sphinx build) over HTTP on
+localhost and measures how fast `crawl_pages` gets through it for several worker
+counts. `--latency` adds an artificial per-request delay to mimic a real network.
+
+Usage:
+    python bench_crawler.py ./docs_mirror --workers 1 4 8 16 --latency 50
+"""
+
+import argparse
+import functools
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from rag_setup import HostRateLimiter, crawl_pages, fetch_doc_links, make_session
+
+
+class _DocsHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_docs(docs_dir, latency_ms=0):
+    """Start a threaded HTTP server for `docs_dir` on a free localhost port."""
+    handler = functools.partial(_DocsHandler, directory=docs_dir)
+    _DocsHandler.latency = latency_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def run(base_url, workers, rate):
+    session = make_session(workers)
+    limiter = HostRateLimiter(rate)
+    links = fetch_doc_links(session, base_url=base_url, limiter=limiter)
+    start = time.perf_counter()
+    pages = 0
+    chars = 0
+    for _, text in crawl_pages(links, workers=workers, session=session, limiter=limiter):
+        if text:
+            pages += 1
+            chars += len(text)
+    elapsed = time.perf_counter() - start
+    session.close()
+    return len(links), pages, chars, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rag_setup crawler against a local docs mirror")
+    parser.add_argument("docs_dir", help="Directory containing reference.html and the reference pages")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.0, help="Artificial per-request latency in ms")
+    parser.add_argument("--rate", type=float, default=0.0, help="Per-host requests/second limit (0 disables)")
+    args = parser.parse_args()
+
+    server = serve_docs(args.docs_dir, args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    print(f"[INFO] Serving {args.docs_dir} at {base_url} (latency {args.latency:.0f} ms)")
+    try:
+        print(f"{'workers':>8} {'links':>6} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'MB text/s':>10}")
+        for workers in args.workers:
+            links, pages, chars, elapsed = run(base_url, workers, args.rate)
+            print(
+                f"{workers:>8} {links:>6} {pages:>6} {elapsed:>8.2f} "
+                f"{pages / max(elapsed, 1e-9):>8.1f} {chars / 1e6 / max(elapsed, 1e-9):>10.2f}"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
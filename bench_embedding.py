@@ -0,0 +1,79 @@
+"""
+Embedding throughput benchmark for rag_setup.ChunkEncoder.
+
+Encodes the chunks of an existing build (the chunk store of the live version in manim_rag_db) with
+several worker counts and reports chunks/s. Every run is checked against the
+single-process output: same shape and the largest absolute difference between
+matching rows, which would be large if any row came back out of order.
+
+Usage:
+    python bench_embedding.py --workers 1 2 4 8 --batch-size 32 --limit 5000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from chunk_store import iter_chunks
+from rag_setup import ENCODE_BATCH_SIZE, ChunkEncoder, current_version_dir
+
+
+def load_chunks(directory, limit):
+    texts = []
+    for _, _, text in iter_chunks(directory):
+        texts.append(text)
+        if limit and len(texts) >= limit:
+            break
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single- vs multi-process chunk embedding")
+    parser.add_argument("--store", default=None, help="Directory holding the chunk store to read texts from (default: the live build)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--limit", type=int, default=0, help="Only encode the first N chunks")
+    args = parser.parse_args()
+    args.store = args.store or current_version_dir()
+    if args.store is None:
+        parser.error("no live build; pass --store")
+
+    texts = load_chunks(args.store, args.limit)
+    print(f"[INFO] Encoding {len(texts)} chunks, batch size {args.batch_size}")
+
+    baseline = ChunkEncoder(workers=1, batch_size=args.batch_size)
+    baseline.encode(texts[:args.batch_size])  # load the model outside the timed region
+    start = time.perf_counter()
+    reference = np.asarray(baseline.encode(texts))
+    base_time = time.perf_counter() - start
+
+    print(f"{'workers':>8} {'startup s':>10} {'encode s':>9} {'chunks/s':>9} {'speedup':>8} {'max |diff|':>11} {'identical':>10}")
+    print(f"{1:>8} {0.0:>10.2f} {base_time:>9.2f} {len(texts) / base_time:>9.1f} {1.0:>8.2f} {0.0:>11.2e} {'yes':>10}")
+    for workers in args.workers:
+        if workers <= 1:
+            continue
+        encoder = ChunkEncoder(workers=workers, batch_size=args.batch_size)
+        encoder._model = baseline._model
+        start = time.perf_counter()
+        encoder._start_pool()
+        # Workers import torch and receive the model lazily; warm them up outside the timed encode
+        encoder.encode(texts[:workers * args.batch_size])
+        startup = time.perf_counter() - start
+        try:
+            start = time.perf_counter()
+            embeddings = np.asarray(encoder.encode(texts))
+            elapsed = time.perf_counter() - start
+        finally:
+            encoder.close()
+        same_shape = embeddings.shape == reference.shape
+        max_diff = float(np.abs(embeddings - reference).max()) if same_shape and len(texts) else float("nan")
+        identical = same_shape and bool(np.allclose(embeddings, reference, atol=1e-5))
+        print(
+            f"{workers:>8} {startup:>10.2f} {elapsed:>9.2f} {len(texts) / elapsed:>9.1f} "
+            f"{base_time / elapsed:>8.2f} {max_diff:>11.2e} {'yes' if identical else 'NO':>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
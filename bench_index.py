@@ -0,0 +1,136 @@
+"""
+Recall/latency/memory benchmark for the index types rag_setup can build.
+
+Embeds the chunks of an existing build (through the embedding cache, so this is
+cheap after a build), builds every requested index variant in memory and
+compares it with the exact float32 L2 flat index on a fixed query set plus
+queries made from random chunk openings. "fixed recall" is measured on the
+fixed query set alone, so quality changes from normalization or quantization
+are comparable across runs.
+
+Usage:
+    python bench_index.py --k 5 --variants flat ivf_flat:nlist=64,nprobe=8 \
+        ivf_pq:nlist=64,pq_m=16 hnsw:hnsw_m=32,ef_search=64 \
+        flat:metric=cosine,storage=float16 flat:metric=cosine,storage=int8
+"""
+
+import argparse
+import random
+import time
+
+import faiss
+import numpy as np
+
+from chunk_store import iter_chunks
+from embedding_cache import EmbeddingCache
+from rag_setup import (
+    EMBED_CACHE_DIR, EMBED_MODEL, INDEX_PARAMS, ChunkEncoder,
+    apply_search_params, current_version_dir, make_index, make_index_config, prepare_vectors, training_size,
+)
+
+FIXED_QUERIES = [
+    "Axes get_graph",
+    "VGroup arrange",
+    "get_riemann_rectangles",
+    "how to animate a transformation between two shapes",
+    "add coordinate labels to a number plane",
+    "write text on screen with a fade in",
+    "plot a parametric function",
+    "change the color of a mobject",
+    "move the camera in a 3D scene",
+    "MathTex with multiple parts",
+]
+
+
+def parse_variant(spec):
+    index_type, _, params = spec.partition(":")
+    overrides = {}
+    for item in filter(None, params.split(",")):
+        name, _, value = item.partition("=")
+        overrides[name] = type(INDEX_PARAMS[name])(value)
+    return spec, make_index_config(index_type, overrides)
+
+
+def embed(texts, encoder, cache):
+    return cache.encode(texts, encoder.encode) if cache is not None else np.asarray(encoder.encode(texts), dtype="float32")
+
+
+def build(config, vectors, ids):
+    vectors = prepare_vectors(vectors, config)
+    train = vectors[:training_size(config)] if training_size(config) else None
+    index, used = make_index(vectors.shape[1], config, train)
+    index.add_with_ids(vectors, ids)
+    apply_search_params(index, used)
+    return index, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall@k, QPS and memory of FAISS index variants")
+    parser.add_argument("--store", default=None, help="Directory holding the chunk store (default: the live build)")
+    parser.add_argument("--variants", nargs="+", default=["flat", "ivf_flat", "ivf_pq", "hnsw"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--sample-queries", type=int, default=200, help="Extra queries taken from chunk openings")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.store = args.store or current_version_dir()
+    if args.store is None:
+        parser.error("no live build; pass --store")
+
+    ids, texts = [], []
+    for chunk_id, _, text in iter_chunks(args.store):
+        ids.append(chunk_id)
+        texts.append(text)
+    ids = np.array(ids, dtype="int64")
+
+    encoder = ChunkEncoder(EMBED_MODEL)
+    cache = EmbeddingCache(EMBED_MODEL, EMBED_CACHE_DIR) if EMBED_CACHE_DIR else None
+    vectors = embed(texts, encoder, cache)
+    rng = random.Random(args.seed)
+    sampled = [" ".join(t.split()[:12]) for t in rng.sample(texts, min(args.sample_queries, len(texts)))]
+    queries = np.asarray(encoder.encode(FIXED_QUERIES + sampled), dtype="float32")
+    encoder.close()
+    print(f"[INFO] {len(ids)} vectors (dim {vectors.shape[1]}), {len(queries)} queries, k={args.k}")
+
+    exact = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    exact.add_with_ids(vectors, ids)
+    _, truth = exact.search(queries, args.k)
+
+    clamped = False
+    print(
+        f"{'variant':<40} {'build s':>8} {'recall@k':>9} {'fixed recall':>13} {'QPS':>9} "
+        f"{'p50 ms':>7} {'batch QPS':>10} {'size MB':>8}"
+    )
+    for spec, config in map(parse_variant, args.variants):
+        start = time.perf_counter()
+        index, used = build(config, vectors, ids)
+        build_time = time.perf_counter() - start
+        variant_queries = prepare_vectors(queries, config)
+
+        # One query per call, like rag_retriever does
+        latencies = []
+        found = []
+        for query in variant_queries:
+            start = time.perf_counter()
+            _, hits = index.search(query[None, :], args.k)
+            latencies.append(time.perf_counter() - start)
+            found.append(hits[0])
+        start = time.perf_counter()
+        index.search(variant_queries, args.k)
+        batch_time = time.perf_counter() - start
+
+        per_query = [len(set(f) & set(t)) / args.k for f, t in zip(found, truth)]
+        recall = np.mean(per_query)
+        fixed_recall = np.mean(per_query[:len(FIXED_QUERIES)])
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        label = spec if used["params"] == config["params"] else spec + "*"
+        clamped = clamped or label != spec
+        print(
+            f"{label:<40} {build_time:>8.2f} {recall:>9.3f} {fixed_recall:>13.3f} {len(queries) / sum(latencies):>9.0f} "
+            f"{np.median(latencies) * 1e3:>7.3f} {len(queries) / batch_time:>10.0f} {size_mb:>8.2f}"
+        )
+    if clamped:
+        print("* parameters were clamped to fit the corpus size")
+
+
+if __name__ == "__main__":
+    main()
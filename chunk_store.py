@@ -0,0 +1,144 @@
+"""
+Compact on-disk chunk store shared by rag_setup (writer) and rag_retriever (reader).
+
+    manim_chunks.bin   UTF-8 chunk texts, back to back
+    manim_chunks.idx   RECORD_DTYPE rows sorted by chunk id: (id, offset, length, url)
+    manim_urls.json    interned URL table, `url` in a record indexes into it
+
+Everything is plain little-endian arrays so readers can np.memmap/mmap the
+files and decode only the chunks they return.
+"""
+
+import json
+import mmap
+import os
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([("id", "<i8"), ("offset", "<i8"), ("length", "<i4"), ("url", "<i4")])
+BLOB_NAME = "manim_chunks.bin"
+RECORDS_NAME = "manim_chunks.idx"
+URLS_NAME = "manim_urls.json"
+COPY_BLOCK = 65536  # records copied per step when compacting
+
+
+def store_paths(directory):
+    return tuple(os.path.join(directory, name) for name in (BLOB_NAME, RECORDS_NAME, URLS_NAME))
+
+
+def store_exists(directory):
+    return all(os.path.exists(path) for path in store_paths(directory))
+
+
+def _open_records(records_path):
+    if os.path.getsize(records_path) == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(records_path, dtype=RECORD_DTYPE, mode="r")
+
+
+def _open_blob(blob_path):
+    with open(blob_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_chunks(directory, overrides=None):
+    """Yield (id, url, text) for every chunk in the store, in id order.
+
+    `overrides` maps file names to alternative paths, e.g. the temp files of a
+    store that has been written but not yet moved into place.
+    """
+    overrides = overrides or {}
+    blob_path, records_path, urls_path = (overrides.get(os.path.basename(p), p) for p in store_paths(directory))
+    with open(urls_path, "r", encoding="utf-8") as f:
+        urls = json.load(f)
+    records = _open_records(records_path)
+    blob = _open_blob(blob_path)
+    for start in range(0, len(records), COPY_BLOCK):
+        for record in np.array(records[start:start + COPY_BLOCK]):
+            offset = int(record["offset"])
+            text = blob[offset:offset + int(record["length"])].decode("utf-8")
+            yield int(record["id"]), urls[record["url"]], text
+
+
+class ChunkStoreWriter:
+    """Appends new chunks to side files and merges them with the surviving old chunks on `finish`.
+
+    The old store is streamed block by block, never loaded, so memory use does
+    not grow with the corpus. It is read from `source_directory` (default:
+    `directory`, the directory the merged store is written to).
+    """
+
+    def __init__(self, directory, keep_existing=True, source_directory=None):
+        self.blob_path, self.records_path, self.urls_path = store_paths(directory)
+        source_directory = directory if source_directory is None else source_directory
+        self.source_blob_path, self.source_records_path, source_urls_path = store_paths(source_directory)
+        self.keep_existing = keep_existing and store_exists(source_directory)
+        self.urls = []
+        if self.keep_existing:
+            with open(source_urls_path, "r", encoding="utf-8") as f:
+                self.urls = json.load(f)
+        self._url_ids = {url: i for i, url in enumerate(self.urls)}
+        self._new_blob = open(self.blob_path + ".new", "wb")
+        self._new_records = open(self.records_path + ".new", "wb")
+        self._new_size = 0
+
+    def _url_id(self, url):
+        if url not in self._url_ids:
+            self._url_ids[url] = len(self.urls)
+            self.urls.append(url)
+        return self._url_ids[url]
+
+    def append(self, chunks):
+        """Append (id, url, text) tuples; ids must keep increasing."""
+        records = np.zeros(len(chunks), dtype=RECORD_DTYPE)
+        for row, (chunk_id, url, text) in enumerate(chunks):
+            data = text.encode("utf-8")
+            records[row] = (chunk_id, self._new_size, len(data), self._url_id(url))
+            self._new_blob.write(data)
+            self._new_size += len(data)
+        self._new_records.write(records.tobytes())
+
+    @staticmethod
+    def _copy(records_path, blob_path, removed, out_blob, out_records, written):
+        records = _open_records(records_path)
+        blob = _open_blob(blob_path)
+        for start in range(0, len(records), COPY_BLOCK):
+            block = np.array(records[start:start + COPY_BLOCK])
+            if len(removed):
+                block = block[~np.isin(block["id"], removed)]
+            for record in block:
+                offset = int(record["offset"])
+                out_blob.write(blob[offset:offset + int(record["length"])])
+            block["offset"] = written + np.cumsum(block["length"], dtype="int64") - block["length"]
+            written += int(block["length"].sum())
+            out_records.write(block.tobytes())
+        return written
+
+    def finish(self, removed_ids):
+        """Write old-minus-removed plus new chunks to temp files.
+
+        Returns (temp_path, final_path) pairs for the caller to os.replace once
+        the matching index is safely on disk.
+        """
+        self._new_blob.close()
+        self._new_records.close()
+        removed = np.array(sorted(set(removed_ids)), dtype="int64")
+        with open(self.blob_path + ".tmp", "wb") as out_blob, open(self.records_path + ".tmp", "wb") as out_records:
+            written = 0
+            # Surviving old records first, then the new ones: ids stay sorted for the reader's binary search
+            if self.keep_existing:
+                written = self._copy(self.source_records_path, self.source_blob_path, removed, out_blob, out_records, written)
+            self._copy(self.records_path + ".new", self.blob_path + ".new", removed[:0], out_blob, out_records, written)
+        with open(self.urls_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.urls, f)
+        self.discard()
+        return [(path + ".tmp", path) for path in (self.blob_path, self.records_path, self.urls_path)]
+
+    def discard(self):
+        """Drop the side files, e.g. when the build turned out to change nothing."""
+        for f in (self._new_blob, self._new_records):
+            f.close()
+            if os.path.exists(f.name):
+                os.remove(f.name)
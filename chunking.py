@@ -0,0 +1,233 @@
+"""
+Structure-aware page cleaning and chunking for rag_setup.
+
+`html_to_text` flattens a docs page into a light markdown-like text: `#` heading
+lines, fenced code blocks and blank-line separated paragraphs. `chunk_text`
+parses that back into blocks and packs whole blocks into chunks of at most
+`max_tokens`, never across a heading and never splitting a code block. Each
+chunk starts with its heading path (e.g. "Axes > get_graph") so it is
+self-describing. `MinHashDeduper` drops near-duplicate chunks, such as an
+example or signature block a page repeats.
+"""
+
+import re
+import zlib
+
+import numpy as np
+from bs4 import Comment, NavigableString
+
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {
+    "div", "section", "article", "main", "ul", "ol", "dl", "blockquote", "table", "thead", "tbody",
+    "tr", "figure", "p", "li", "dt", "dd", "td", "th", "caption", "figcaption",
+}
+SKIP_SELECTOR = "script, style, nav, a.headerlink"  # headerlink: Sphinx's pilcrow anchors next to headings
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_HEADING_LINE = re.compile(r"(#{1,6}) (.+)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+MIN_BODY_TOKENS = 32  # floor for a chunk body when the heading path is very long
+
+
+def count_tokens(text):
+    """Approximate WordPiece token count: words and punctuation marks.
+
+    Rare identifiers split into a few more pieces than this counts, so chunk
+    limits are set somewhat below the model's real window.
+    """
+    return len(_TOKEN.findall(text))
+
+
+def html_to_text(doc):
+    """Flatten a BeautifulSoup element into headings, fenced code blocks and paragraphs.
+
+    Elements matching SKIP_SELECTOR are removed from `doc` first.
+    """
+    for element in doc.select(SKIP_SELECTOR):
+        element.decompose()
+    blocks = []
+    inline = []
+
+    def flush():
+        text = " ".join("".join(inline).split())
+        if text:
+            blocks.append(text)
+        inline.clear()
+
+    def walk(node):
+        for child in node.children:
+            if isinstance(child, Comment):
+                continue
+            if isinstance(child, NavigableString):
+                inline.append(str(child))
+                continue
+            if child.name in HEADINGS:
+                flush()
+                title = " ".join(child.get_text(" ").split())
+                if title:
+                    blocks.append("#" * HEADINGS[child.name] + " " + title)
+            elif child.name == "pre":
+                flush()
+                code = child.get_text().strip("\n")
+                if code.strip():
+                    blocks.append(f"```\n{code}\n```")
+            elif child.name == "br":
+                inline.append(" ")
+            elif child.name in BLOCK_TAGS:
+                flush()
+                walk(child)
+                flush()
+            else:
+                walk(child)
+
+    walk(doc)
+    flush()
+    return "\n\n".join(blocks)
+
+
+def parse_blocks(text):
+    """Yield ("heading", (level, title)), ("code", text) and ("text", paragraph) blocks."""
+    paragraph = []
+    lines = iter(text.split("\n"))
+    for line in lines:
+        heading = _HEADING_LINE.fullmatch(line)
+        if line.startswith("```") or heading or not line.strip():
+            if paragraph:
+                yield "text", " ".join(paragraph)
+                paragraph = []
+        if line.startswith("```"):
+            code = [line]
+            for code_line in lines:
+                code.append(code_line)
+                if code_line.startswith("```"):
+                    break
+            yield "code", "\n".join(code)
+        elif heading:
+            yield "heading", (len(heading.group(1)), heading.group(2).strip())
+        elif line.strip():
+            paragraph.append(line.strip())
+    if paragraph:
+        yield "text", " ".join(paragraph)
+
+
+def _split_text(text, max_tokens):
+    """Split an over-long paragraph at sentence ends, and over-long sentences at words."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces = []
+    current, current_tokens = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        parts = [sentence]
+        if count_tokens(sentence) > max_tokens:
+            parts = [" ".join(w) for w in _word_windows(sentence.split(), max_tokens)]
+        for part in parts:
+            tokens = count_tokens(part)
+            if current and current_tokens + tokens > max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _word_windows(words, max_tokens):
+    window, tokens = [], 0
+    for word in words:
+        size = count_tokens(word)
+        if window and tokens + size > max_tokens:
+            yield window
+            window, tokens = [], 0
+        window.append(word)
+        tokens += size
+    if window:
+        yield window
+
+
+def chunk_text(text, max_tokens=256):
+    """Split page text into chunks of whole blocks, each prefixed with its heading path.
+
+    Paragraphs longer than the limit are split at sentence ends; code blocks
+    are always kept whole, even when longer than `max_tokens`.
+    """
+    chunks = []
+    path = []
+    body, body_tokens = [], 0
+
+    def flush():
+        nonlocal body, body_tokens
+        if body:
+            prefix = " > ".join(title for _, title in path)
+            chunks.append((prefix + "\n" if prefix else "") + "\n\n".join(body))
+        body, body_tokens = [], 0
+
+    for kind, payload in parse_blocks(text):
+        if kind == "heading":
+            flush()
+            level, title = payload
+            path = [entry for entry in path if entry[0] < level] + [payload]
+            continue
+        limit = max(max_tokens - count_tokens(" > ".join(title for _, title in path)), MIN_BODY_TOKENS)
+        for piece in [payload] if kind == "code" else _split_text(payload, limit):
+            tokens = count_tokens(piece)
+            if body and body_tokens + tokens > limit:
+                flush()
+            body.append(piece)
+            body_tokens += tokens
+    flush()
+    return chunks
+
+
+class MinHashDeduper:
+    """Drops chunks whose estimated word-shingle Jaccard similarity to an earlier chunk reaches `threshold`.
+
+    Signatures use `num_perm` hash functions; LSH over `bands` bands keeps each
+    lookup to the few earlier chunks sharing a band, so filtering a corpus is
+    roughly linear in its size.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, shingle_size=5, seed=0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = np.random.RandomState(seed)
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.rows = num_perm // bands
+        self.masks = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.multipliers = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+        self.signatures = []
+        self.buckets = {}
+        self.dropped = 0
+
+    def signature(self, text):
+        words = text.lower().split()
+        size = self.shingle_size
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        mixed = (hashes[:, None] ^ self.masks[None, :]) * self.multipliers[None, :]
+        mixed ^= mixed >> np.uint64(31)
+        return mixed.min(axis=0)
+
+    def is_duplicate(self, text):
+        """Return True for a near-duplicate, otherwise remember `text` and return False."""
+        signature = self.signature(text)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(len(signature) // self.rows)]
+        candidates = {row for key in keys for row in self.buckets.get(key, ())}
+        for row in candidates:
+            if np.mean(self.signatures[row] == signature) >= self.threshold:
+                self.dropped += 1
+                return True
+        row = len(self.signatures)
+        self.signatures.append(signature)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(row)
+        return False
+
+    def reset(self):
+        """Forget the chunks seen so far (the hash functions and the `dropped` count are kept)."""
+        self.signatures = []
+        self.buckets = {}
+
+    def filter(self, chunks):
+        return [chunk for chunk in chunks if not self.is_duplicate(chunk)]
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+
+EMBED_CACHE_DTYPE = os.getenv("RAG_EMBED_CACHE_DTYPE", "float16")  # float16 halves the cache, float32 is exact
+
+
+class EmbeddingCache:
+    """Append-only on-disk embedding cache keyed by (model name, SHA-1 of the chunk text).
+
+    Layout under ``<cache_dir>/<model>/<dtype>/``:
+        keys.txt     one hex digest per line, line N describes row N
+        vectors.bin  raw row-major vectors in `dtype`
+        dim.txt      embedding dimension
+
+    Vectors computed on a miss are passed through `dtype` before being
+    returned, so a build produces the same vectors whether it hit or missed.
+    """
+
+    def __init__(self, model_name, cache_dir, dtype=EMBED_CACHE_DTYPE):
+        if dtype not in ("float16", "float32"):
+            raise ValueError("Embedding cache dtype must be float16 or float32")
+        self.dtype = np.dtype(dtype)
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name), dtype)
+        self.keys_path = os.path.join(self.dir, "keys.txt")
+        self.vectors_path = os.path.join(self.dir, "vectors.bin")
+        self.dim_path = os.path.join(self.dir, "dim.txt")
+        self.hits = 0
+        self.misses = 0
+        self.dim = None
+        self._rows = {}
+        self._vectors = None
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.dim_path):
+            return
+        with open(self.dim_path, "r", encoding="utf-8") as f:
+            self.dim = int(f.read().strip())
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                keys = [line.strip() for line in f if line.strip()]
+        row_bytes = self.dim * self.dtype.itemsize
+        rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if rows != len(keys):
+            # An interrupted append left the two files out of step; keep the common prefix
+            print(f"[WARN] Embedding cache {self.dir} is inconsistent, truncating to {min(rows, len(keys))} rows")
+            keys = keys[:rows]
+            with open(self.keys_path, "w", encoding="utf-8") as f:
+                f.writelines(key + "\n" for key in keys)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(len(keys) * row_bytes)
+        self._rows = {key: row for row, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _append(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.dim_path, "w", encoding="utf-8") as f:
+                f.write(str(self.dim))
+        # Vectors before keys: a crash in between leaves extra rows, which _load trims
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.keys_path, "a", encoding="utf-8") as f:
+            f.writelines(key + "\n" for key in keys)
+        start = len(self._rows)
+        for offset, key in enumerate(keys):
+            self._rows[key] = start + offset
+        self._vectors = None
+
+    def _matrix(self):
+        if self._vectors is None:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(len(self._rows), self.dim))
+        return self._vectors
+
+    def encode(self, texts, encode_fn):
+        """Return float32 embeddings for `texts`, calling `encode_fn` only on texts not cached yet."""
+        keys = [self.key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self._rows:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(key, text)
+        if missing:
+            self._append(list(missing), encode_fn(list(missing.values())))
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype="float32")
+        rows = np.fromiter((self._rows[key] for key in keys), dtype="int64", count=len(keys))
+        return np.asarray(self._matrix()[rows], dtype="float32")
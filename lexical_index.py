@@ -0,0 +1,138 @@
+"""
+BM25 inverted index over the chunk store, written by rag_setup next to the FAISS index.
+
+    manim_lexical.json   {"k1", "b", "num_docs", "terms": {term: [offset, count]}}
+    manim_lexical.bin    POSTING_DTYPE rows grouped by term: (chunk id, BM25 weight)
+
+Weights are precomputed at build time (idf * saturated, length-normalized tf),
+so a query is just the sum of its terms' posting weights per chunk and needs
+neither the embedding model nor the FAISS index. rag_retriever reads these
+files (see _LexicalIndex there).
+
+The build keeps only the vocabulary in Python objects: postings are buffered
+in flat arrays and spilled to disk as runs sorted by term, which are merged
+one term at a time, so memory grows with the vocabulary and 16 bytes per
+chunk rather than with the text.
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from collections import Counter
+
+import numpy as np
+
+POSTING_DTYPE = np.dtype([("id", "<i8"), ("weight", "<f4")])
+RUN_DTYPE = np.dtype([("term", "<i8"), ("id", "<i8"), ("tf", "<i4")])  # spilled (term id, chunk id, tf) rows
+TERMS_NAME = "manim_lexical.json"
+POSTINGS_NAME = "manim_lexical.bin"
+BM25_K1 = 1.2
+BM25_B = 0.75
+SPILL_POSTINGS = int(os.getenv("RAG_LEXICAL_SPILL_POSTINGS", "1000000"))  # postings buffered per sorted run
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def tokenize(text):
+    """Lowercased identifiers plus the parts of snake_case ones.
+
+    `get_riemann_rectangles` yields itself, `get`, `riemann` and `rectangles`,
+    so both the exact symbol and its words can be matched. rag_retriever
+    tokenizes queries with it too.
+    """
+    tokens = []
+    for match in _IDENTIFIER.findall(text):
+        token = match.lower()
+        tokens.append(token)
+        if "_" in token.strip("_"):
+            tokens.extend(part for part in token.split("_") if part)
+    return tokens
+
+
+def lexical_paths(directory):
+    return tuple(os.path.join(directory, name) for name in (TERMS_NAME, POSTINGS_NAME))
+
+
+def lexical_exists(directory):
+    return all(os.path.exists(path) for path in lexical_paths(directory))
+
+
+def _spill(run_dir, terms, ids, tfs):
+    """Write buffered postings to `run_dir` as one run sorted by (term id, chunk id)."""
+    rows = np.empty(len(terms), dtype=RUN_DTYPE)
+    rows["term"], rows["id"], rows["tf"] = terms, ids, tfs
+    rows = rows[np.lexsort((rows["id"], rows["term"]))]
+    path = os.path.join(run_dir, f"run{len(os.listdir(run_dir)):06d}.bin")
+    rows.tofile(path)
+    return path
+
+
+def write_lexical_index(chunks, directory, spill_postings=SPILL_POSTINGS):
+    """Build the index from (id, url, text) tuples into temp files.
+
+    Returns (temp_path, final_path) pairs for the caller to os.replace together
+    with the rest of the store.
+    """
+    vocabulary = {}  # term -> term id, in order of first appearance
+    doc_ids, doc_lengths = array("q"), array("q")
+    terms, ids, tfs = array("q"), array("q"), array("q")
+    run_dir = tempfile.mkdtemp(prefix=".lexical-runs-", dir=directory)
+    try:
+        run_paths = []
+        for chunk_id, _, text in chunks:
+            counts = Counter(tokenize(text))
+            doc_ids.append(chunk_id)
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                ids.append(chunk_id)
+                tfs.append(tf)
+            if len(terms) >= spill_postings:
+                run_paths.append(_spill(run_dir, terms, ids, tfs))
+                terms, ids, tfs = array("q"), array("q"), array("q")
+        if terms:
+            run_paths.append(_spill(run_dir, terms, ids, tfs))
+        del terms, ids, tfs
+
+        doc_ids = np.frombuffer(doc_ids, dtype=np.int64)
+        doc_lengths = np.frombuffer(doc_lengths, dtype=np.int64)
+        order = np.argsort(doc_ids, kind="stable")
+        doc_ids, doc_lengths = doc_ids[order], doc_lengths[order]
+        num_docs = len(doc_ids)
+        avgdl = float(doc_lengths.sum()) / num_docs if num_docs else 0.0
+
+        runs = [np.memmap(path, dtype=RUN_DTYPE, mode="r") for path in run_paths]
+        run_terms = [run["term"] for run in runs]
+        terms_path, postings_path = lexical_paths(directory)
+        term_offsets = {}
+        offset = 0
+        with open(postings_path + ".tmp", "wb") as f:
+            for term in sorted(vocabulary):
+                # Each run holds a sorted slice for the term; runs follow input order, so sort by id after joining
+                term_id = vocabulary[term]
+                parts = []
+                for run, column in zip(runs, run_terms):
+                    lo, hi = np.searchsorted(column, term_id, "left"), np.searchsorted(column, term_id, "right")
+                    if hi > lo:
+                        parts.append(run[lo:hi])
+                docs = np.concatenate(parts)
+                docs = docs[np.argsort(docs["id"], kind="stable")]
+                idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                tf = docs["tf"].astype(np.float64)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[np.searchsorted(doc_ids, docs["id"])] / avgdl)
+                rows = np.empty(len(docs), dtype=POSTING_DTYPE)
+                rows["id"] = docs["id"]
+                rows["weight"] = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                f.write(rows.tobytes())
+                term_offsets[term] = [offset, len(docs)]
+                offset += len(docs)
+        del runs, run_terms
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    with open(terms_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"k1": BM25_K1, "b": BM25_B, "num_docs": num_docs, "terms": term_offsets}, f)
+    return [(path + ".tmp", path) for path in (terms_path, postings_path)]
@@ -7,12 +7,17 @@ This module integrates the RAG system with the LLM to provide audio-first workfl
 """
 
 import os
+import sys
 import json
-import google.generativeai as genai
 from pathlib import Path
 from dotenv import load_dotenv
 from typing import Optional, Dict, Tuple
 
+# Shared Gemini client (configured once, cached models, fence stripping) lives with the infographic app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "manim-gemini-infographic", "src"))
+import gemini_client
+import async_llm
+
 try:
     from app.rag_system import ManimRAG
 except ImportError:
@@ -35,7 +40,7 @@ current_api_key = primary_key
 # Function to switch API keys when quota/rate limits are hit
 def switch_api_key():
     """Switch between primary and backup API keys"""
-    global current_api_key, primary_key, backup_key, model
+    global current_api_key, primary_key, backup_key
 
     if current_api_key == primary_key and backup_key:
         print("🔄 Switching to backup API key due to rate/quota limits")
@@ -47,15 +52,32 @@ def switch_api_key():
         print("⚠️ No alternative API key available")
         return False
 
-    # Reconfigure with new key
-    genai.configure(api_key=current_api_key)
-    model = genai.GenerativeModel("gemini-2.5-flash")
+    # Reconfigure with new key (drops the models cached for the old one)
+    gemini_client.configure(api_key=current_api_key)
     print(f"✅ API key switched successfully")
     return True
 
-# Initial configuration
-genai.configure(api_key=current_api_key)
-model = genai.GenerativeModel("gemini-2.5-flash")
+# Initial configuration; without GOOGLE_API_KEY2, gemini_client reads GOOGLE_API_KEY on the
+# first request that misses the cache, so a replayed run needs no key at all
+if current_api_key:
+    gemini_client.configure(api_key=current_api_key)
+
+def _generate_with_key(prompt, system_instruction=None, **kwargs):
+    """gemini_client.generate, tagging a failure with the API key the request was sent with"""
+    api_key = current_api_key
+    try:
+        return gemini_client.generate(prompt, system_instruction, **kwargs)
+    except Exception as e:
+        e.api_key = api_key
+        raise
+
+def _on_quota_error(error):
+    # Concurrent 429s from the exhausted key must flip it once, not flip back to it
+    if getattr(error, "api_key", current_api_key) == current_api_key:
+        switch_api_key()
+
+# Rate-limited client (GEMINI_RPM/GEMINI_TPM/GEMINI_CONCURRENCY) that backs off on 429s and flips keys
+llm_client = async_llm.AsyncLLMClient(_generate_with_key, on_quota_error=_on_quota_error)
 
 
 class AudioFirstRAGEnhancedManimLLM:
@@ -631,7 +653,7 @@ REQUIREMENTS:
 OUTPUT: Return only the script text, no formatting or extra content.
 """
 
-        # Add retry logic for script generation to handle RPM limits
+        # Quota errors are retried with backoff inside llm_client; other failures get a few more attempts
         max_attempts = 3
 
         for attempt in range(max_attempts):
@@ -643,14 +665,8 @@ OUTPUT: Return only the script text, no formatting or extra content.
 Generate clear, engaging educational scripts that explain complex concepts in an accessible way.
 CRITICAL: Generate ONLY the script content without any markdown formatting, explanations, or meta-text."""
 
-                # Configure model with system instructions
-                model_with_system = genai.GenerativeModel(
-                    "gemini-2.5-flash",
-                    system_instruction=system_instructions
-                )
-
-                response = model_with_system.generate_content(script_prompt)
-                script = response.text.strip()
+                # Cached model with system instructions, sent through the rate limiter
+                script = llm_client.generate_sync(script_prompt, system_instructions)
 
                 # Clean up any unwanted formatting
                 script = script.replace("```", "").replace("**", "").strip()
@@ -659,28 +675,12 @@ CRITICAL: Generate ONLY the script content without any markdown formatting, expl
                 return script
 
             except Exception as e:
-                error_str = str(e).lower()
                 print(f"⚠️ Script generation attempt {attempt + 1} failed: {e}")
+                if async_llm.is_quota_error(e):
+                    break  # llm_client already retried with backoff until GEMINI_MAX_RETRIES
 
-                # Check if it's a rate limit or quota error
-                if "429" in error_str or "quota" in error_str or "rate" in error_str:
-                    if attempt < max_attempts - 1:
-                        # Try switching API key first
-                        if switch_api_key():
-                            print("🔄 Retrying with different API key...")
-                            continue
-                        else:
-                            # If no API key switch possible, wait and retry
-                            import time
-                            wait_time = (attempt + 1) * 2  # Exponential backoff
-                            print(f"🔄 Rate limit detected, waiting {wait_time}s...")
-                            time.sleep(wait_time)
-                            continue
-
-                # If it's the last attempt or not a rate limit error, return fallback
-                if attempt == max_attempts - 1:
-                    print(f"❌ Script generation failed after {max_attempts} attempts")
-                    return f"Let's explore {prompt} through visual mathematics and discover the beautiful patterns that emerge."
+        print(f"❌ Script generation failed after {attempt + 1} attempts")
+        return f"Let's explore {prompt} through visual mathematics and discover the beautiful patterns that emerge."
 
     def create_natural_audio(self, script: str, job_id: str) -> Tuple[str, Dict]:
         """Create audio at natural speaking pace and return timing info"""
@@ -916,14 +916,8 @@ You are a 3Blue1Brown manim code generator. Your code MUST work without errors.
 
 CRITICAL: Generate ONLY working Python code without markdown or explanations."""
 
-        # Configure model with critical system instructions - MAINTAIN SAME CONTEXT
-        model_with_system = genai.GenerativeModel(
-            "gemini-2.5-flash",
-            system_instruction=system_instructions
-        )
-
-        # Start chat session to maintain context
-        chat_session = model_with_system.start_chat()
+        # Start chat session with critical system instructions to maintain context
+        chat_session = gemini_client.start_chat(system_instructions)
 
         # Collect ALL errors in one pass, with more attempts and RAG examples
         validation_attempts = 1
@@ -934,25 +928,14 @@ CRITICAL: Generate ONLY working Python code without markdown or explanations."""
             try:
                 if attempt == 0:
                     print(f"📝 Initial code generation")
-                    response = chat_session.send_message(code_prompt)
+                    code = gemini_client.send_message(chat_session, code_prompt)
                 else:
                     print(f"🔧 Code validation fix attempt {attempt + 1}")
                     fix_prompt = f"""Fix these validation errors in the code:
 EXISTING CODE: {code}
 ERRORS: {error_msg}
 Return only the corrected code without explanations."""
-                    response = chat_session.send_message(fix_prompt)
-
-                code = response.text.strip()
-
-                # Clean up markdown formatting
-                if code.startswith("```python"):
-                    code = code[9:]
-                elif code.startswith("```"):
-                    code = code[3:]
-                if code.endswith("```"):
-                    code = code[:-3]
-                code = code.strip()
+                    code = gemini_client.send_message(chat_session, fix_prompt, cache=False)
 
                 # Basic validation (only critical errors)
                 is_valid, error_msg, fixed_code = self._validate_manim_code(code)
@@ -1030,17 +1013,7 @@ CRITICAL INSTRUCTIONS:
 - Return the complete corrected code without explanations or markdown
 - Address every single error mentioned above
 """
-                        response = chat_session.send_message(fix_prompt)
-                        code = response.text.strip()
-
-                        # Clean up markdown formatting
-                        if code.startswith("```python"):
-                            code = code[9:]
-                        elif code.startswith("```"):
-                            code = code[3:]
-                        if code.endswith("```"):
-                            code = code[:-3]
-                        code = code.strip()
+                        code = gemini_client.send_message(chat_session, fix_prompt, cache=False)
                     else:
                         print("❌ Max compilation attempts reached, using last attempt")
                         break
@@ -0,0 +1,203 @@
+"""
+Asyncio front end for Gemini calls with client-side rate limiting.
+
+`AsyncLLMClient.generate` runs a blocking `send` (gemini_client.generate by
+default, so the response cache and call stats still apply) in the client's
+thread pool.
+Each request first passes:
+
+    a semaphore   at most `max_concurrency` requests in flight (GEMINI_CONCURRENCY)
+    two buckets   requests/minute (GEMINI_RPM) and tokens/minute (GEMINI_TPM),
+                  refilled continuously; a request is charged its estimated prompt
+                  plus expected output tokens up front, and the difference
+                  once the real reply is known
+
+A quota error (HTTP 429 / ResourceExhausted) is retried after an exponential
+backoff with full jitter, or after the server's "retry in Ns" hint when that is
+longer. `on_quota_error` runs first, e.g. to switch API keys like
+llm_rag_audio_first does.
+
+Sync callers use `generate_sync` / `map_sync`, which run coroutines on one
+background event loop per client; a client is bound to the first loop that
+uses it. bench_llm_client.py measures throughput against a local stub server
+that enforces the same limits.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import gemini_client
+from context_packer import estimate_tokens
+
+MAX_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+RPM = float(os.getenv("GEMINI_RPM", "10"))                # free-tier limits of gemini-2.5-flash
+TPM = float(os.getenv("GEMINI_TPM", "250000"))
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("GEMINI_EXPECTED_OUTPUT_TOKENS", "2048"))  # charged before the reply is known
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "6"))
+BACKOFF_BASE = 1.0   # seconds; the n-th retry waits up to BACKOFF_BASE * 2**n
+BACKOFF_MAX = 60.0
+
+_RETRY_HINT = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", re.I)
+
+
+def is_quota_error(error):
+    """Whether `error` is a rate-limit or quota rejection (HTTP 429, ResourceExhausted)."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    text = str(error).lower()
+    return "429" in text or "quota" in text or "rate limit" in text or "resource has been exhausted" in text
+
+
+def retry_hint(error):
+    """Seconds the server asked us to wait before retrying, if it said."""
+    match = _RETRY_HINT.search(str(error))
+    return float(match.group(1) or match.group(2)) if match else None
+
+
+class TokenBucket:
+    """Never lets more than `rate` units through in any `period` seconds, like the server's sliding window.
+
+    A bucket of `capacity` (default: a tenth of the rate, at least one unit
+    but at most half the rate) refilling at (rate - capacity) per period
+    admits at most capacity + (rate - capacity) in any window, so bursts are
+    small and the sustained rate is just under `rate`. A request larger than
+    the bucket waits for a full bucket and leaves it in debt, so a rate below
+    2 still works, just conservatively. `debit` may also take the level below
+    zero; later `acquire` calls wait the debt out. Waiters are served in FIFO
+    order.
+    """
+
+    def __init__(self, rate, period=60.0, capacity=None):
+        self.capacity = capacity or min(max(1.0, rate / 10), rate / 2)
+        self.rate = (rate - self.capacity) / period  # units per second
+        if self.rate <= 0:
+            raise ValueError(f"TokenBucket needs a positive rate larger than its capacity, got rate={rate}, capacity={self.capacity}")
+        self.level = self.capacity
+        self.waited = 0.0                  # total seconds spent waiting in acquire
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount=1):
+        need = min(amount, self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            start = time.monotonic()
+            self._refill()
+            while self.level < need:
+                await asyncio.sleep((need - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+            self.waited += time.monotonic() - start
+
+    def debit(self, amount):
+        """Take `amount` more (or give back a negative amount) after the fact."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class AsyncLLMClient:
+    """Concurrency-capped, rate-limited, retrying wrapper around a blocking `send(prompt, system_instruction, **kwargs)`.
+
+    Pass `rpm=None` or `tpm=None` to drop a limiter. `on_quota_error(error)`
+    is called on every quota error, before the backoff.
+    """
+
+    def __init__(self, send=None, max_concurrency=MAX_CONCURRENCY, rpm=RPM, tpm=TPM, period=60.0,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 expected_output_tokens=EXPECTED_OUTPUT_TOKENS, on_quota_error=None, verbose=True):
+        self.send = send or gemini_client.generate
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm, period) if rpm else None
+        self.tokens = TokenBucket(tpm, period) if tpm else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.expected_output_tokens = expected_output_tokens
+        self.on_quota_error = on_quota_error
+        self.verbose = verbose
+        self.stats = {"requests": 0, "completed": 0, "failed": 0, "quota_errors": 0, "retries": 0, "backoff_seconds": 0.0}
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="async-llm-send")
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def generate(self, prompt, system_instruction=None, **kwargs):
+        """Send one request through the limiters; quota errors are retried, anything else is raised."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        estimate = estimate_tokens(prompt) + estimate_tokens(system_instruction or "") + self.expected_output_tokens
+        self.stats["requests"] += 1
+        for attempt in range(self.max_retries + 1):
+            if self.requests:
+                await self.requests.acquire(1)
+            if self.tokens:
+                await self.tokens.acquire(estimate)
+            try:
+                async with self._semaphore:
+                    call = functools.partial(self.send, prompt, system_instruction, **kwargs)
+                    reply = await asyncio.get_running_loop().run_in_executor(self._executor, call)
+            except Exception as e:
+                if not is_quota_error(e) or attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    raise
+                self.stats["quota_errors"] += 1
+                self.stats["retries"] += 1
+                if self.on_quota_error:
+                    self.on_quota_error(e)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                delay = max(delay, retry_hint(e) or 0.0)
+                self.stats["backoff_seconds"] += delay
+                if self.verbose:
+                    print(f"[WARN] Quota error, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            if self.tokens:
+                # Charge what the reply actually cost instead of the up-front guess
+                self.tokens.debit(estimate_tokens(reply or "") - self.expected_output_tokens)
+            self.stats["completed"] += 1
+            return reply
+
+    async def map(self, prompts, system_instruction=None, return_exceptions=False, **kwargs):
+        """Replies to `prompts` in order, sent concurrently within the limits."""
+        return await asyncio.gather(
+            *(self.generate(prompt, system_instruction, **kwargs) for prompt in prompts),
+            return_exceptions=return_exceptions,
+        )
+
+    def _background_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="async-llm", daemon=True).start()
+            return self._loop
+
+    def run(self, coroutine):
+        """Run a coroutine of this client on its background loop and wait for the result (for sync code)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._background_loop()).result()
+
+    def generate_sync(self, prompt, system_instruction=None, **kwargs):
+        return self.run(self.generate(prompt, system_instruction, **kwargs))
+
+    def map_sync(self, prompts, system_instruction=None, return_exceptions=False, **kwargs):
+        return self.run(self.map(prompts, system_instruction, return_exceptions, **kwargs))
+
+    def limiter_stats(self):
+        """Request counters plus seconds spent waiting on each bucket."""
+        return dict(
+            self.stats,
+            rpm_wait_seconds=self.requests.waited if self.requests else 0.0,
+            tpm_wait_seconds=self.tokens.waited if self.tokens else 0.0,
+        )
+
@@ -0,0 +1,171 @@
+"""
+LLM client throughput benchmark against a local stub server with Gemini-style quotas.
+
+The stub answers POST /generate after `--latency` seconds and rejects a
+request with HTTP 429 ("Resource has been exhausted ... Please retry in Ns")
+when it would exceed `--rpm` requests or `--tpm` tokens in the trailing
+`--period` seconds. A short period runs a scaled-down minute, so a run takes
+seconds. Three clients send the same `--requests` jobs:
+
+    sequential     one request at a time, sleeping (attempt + 1) * 2 scaled seconds on a 429,
+                   3 attempts (the old generate_natural_script loop)
+    async-nolimit  AsyncLLMClient with the concurrency cap and backoff only
+    async          AsyncLLMClient with the same RPM/TPM limits as the server
+
+Usage:
+    python src/bench_llm_client.py --requests 60 --rpm 60 --tpm 40000 --period 6 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from async_llm import AsyncLLMClient
+from context_packer import estimate_tokens
+
+
+class QuotaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rpm, tpm, period, latency, output_tokens):
+        super().__init__(("127.0.0.1", 0), _QuotaHandler)
+        self.rpm, self.tpm, self.period = rpm, tpm, period
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.window = deque()  # (time, tokens) of accepted requests
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def admit(self, tokens):
+        """Record an accepted request, or return the seconds until it would fit."""
+        with self.lock:
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - self.period:
+                self.window.popleft()
+            used = sum(t for _, t in self.window)
+            if len(self.window) < self.rpm and used + tokens <= self.tpm:
+                self.window.append((now, tokens))
+                return None
+            self.rejected += 1
+            return self.window[0][0] + self.period - now if self.window else self.period
+
+
+class _QuotaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        tokens = estimate_tokens(request["prompt"]) + server.output_tokens
+        wait = server.admit(tokens)
+        if wait is None:
+            time.sleep(server.latency)
+            status, body = 200, {"text": "word " * (server.output_tokens * 4 // 5)}
+        else:
+            status, body = 429, {"error": f"429 Resource has been exhausted (e.g. check quota). Please retry in {wait:.2f}s."}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_send(url):
+    def send(prompt, system_instruction=None):
+        data = json.dumps({"prompt": (system_instruction or "") + prompt}).encode()
+        request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return json.loads(response.read())["text"]
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read()).get("error", str(e))) from None
+    return send
+
+
+def run_sequential(send, prompts, scale):
+    latencies, failed, quota_errors = [], 0, 0
+    for prompt in prompts:
+        start = time.perf_counter()
+        for attempt in range(3):
+            try:
+                send(prompt)
+                latencies.append(time.perf_counter() - start)
+                break
+            except RuntimeError:
+                quota_errors += 1
+                if attempt < 2:
+                    time.sleep((attempt + 1) * 2 * scale)
+        else:
+            failed += 1
+    return latencies, failed, quota_errors
+
+
+def run_async(client, prompts):
+    latencies = []
+
+    async def one(prompt):
+        start = time.perf_counter()
+        await client.generate(prompt)
+        latencies.append(time.perf_counter() - start)
+
+    async def all_prompts():
+        return await asyncio.gather(*(one(prompt) for prompt in prompts), return_exceptions=True)
+
+    results = asyncio.run(all_prompts())
+    return latencies, sum(isinstance(r, Exception) for r in results), client.stats["quota_errors"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM client throughput under RPM/TPM quotas")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--rpm", type=int, default=60, help="Requests allowed per period")
+    parser.add_argument("--tpm", type=int, default=40000, help="Tokens allowed per period")
+    parser.add_argument("--period", type=float, default=6.0, help="Quota window in seconds (60 = real minutes)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Server seconds per accepted request")
+    parser.add_argument("--prompt-tokens", type=int, default=300)
+    parser.add_argument("--output-tokens", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--clients", nargs="+", default=["sequential", "async-nolimit", "async"])
+    args = parser.parse_args()
+
+    prompts = [f"job {n}: " + "x" * (args.prompt_tokens * 4) for n in range(args.requests)]
+    scale = args.period / 60.0
+    print(f"{'client':<14} {'done':>5} {'failed':>6} {'429s':>5} {'wall s':>7} {'req/s':>6} {'tok/s':>7} {'p50 s':>6} {'p95 s':>6}")
+    for name in args.clients:
+        server = QuotaServer(args.rpm, args.tpm, args.period, args.latency, args.output_tokens)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        send = make_send(f"http://127.0.0.1:{server.server_address[1]}/generate")
+        start = time.perf_counter()
+        if name == "sequential":
+            latencies, failed, quota_errors = run_sequential(send, prompts, scale)
+        else:
+            limits = {"rpm": None, "tpm": None} if name == "async-nolimit" else {"rpm": args.rpm, "tpm": args.tpm}
+            client = AsyncLLMClient(
+                send, max_concurrency=args.concurrency, period=args.period, backoff_base=scale,
+                backoff_max=60 * scale, expected_output_tokens=args.output_tokens, verbose=False, **limits,
+            )
+            latencies, failed, quota_errors = run_async(client, prompts)
+        wall = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+        done = len(latencies)
+        latencies = np.array(latencies or [0.0])
+        tokens = done * (args.prompt_tokens + args.output_tokens)
+        print(
+            f"{name:<14} {done:>5} {failed:>6} {quota_errors:>5} {wall:>7.1f} {done / wall:>6.2f} {tokens / wall:>7.0f} "
+            f"{np.percentile(latencies, 50):>6.2f} {np.percentile(latencies, 95):>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Query encoder benchmark: PyTorch SentenceTransformer vs the ONNX Runtime backends.
+
+Every backend runs in a fresh interpreter so import and load times are cold.
+Queries are encoded one at a time, as rag_retriever does for a cache miss, and
+the embeddings are compared with the PyTorch ones by cosine similarity.
+
+Usage (after `python src/onnx_encoder.py export --quantize`):
+    python src/bench_query_encoder.py --backends torch onnx:model.onnx onnx:model.int8.onnx --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from onnx_encoder import CHECK_TEXTS, ONNX_DIR
+
+
+def _child(backend, model_name, onnx_dir, repeat):
+    """Runs inside the fresh interpreter; prints one JSON line of measurements."""
+    start = time.perf_counter()
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+    else:
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+        from onnx_encoder import OnnxEncoder
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if backend == "torch":
+        encoder = SentenceTransformer(model_name, device="cpu")
+    else:
+        encoder = OnnxEncoder(onnx_dir, backend.partition(":")[2])
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoder.encode([CHECK_TEXTS[0]])
+    first_query = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for text in CHECK_TEXTS:
+            start = time.perf_counter()
+            encoder.encode([text])
+            latencies.append(time.perf_counter() - start)
+    embeddings = np.asarray(encoder.encode(CHECK_TEXTS), dtype="float32")
+    print(json.dumps({
+        "import": import_time,
+        "load": load_time,
+        "first": first_query,
+        "latencies": latencies,
+        "embeddings": embeddings.tolist(),
+    }))
+
+
+def run(backend, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child", backend,
+        "--model", args.model, "--onnx-dir", args.onnx_dir, "--repeat", str(args.repeat),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time and per-query latency of query encoders")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx:model.onnx", "onnx:model.int8.onnx"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default=ONNX_DIR)
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the query set")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.model, args.onnx_dir, args.repeat)
+        return
+
+    print(f"{'backend':<24} {'import s':>9} {'load s':>7} {'first ms':>9} {'p50 ms':>7} {'p95 ms':>7} {'q/s':>7} {'min cos':>8}")
+    reference = None
+    for backend in args.backends:
+        result = run(backend, args)
+        embeddings = np.asarray(result["embeddings"], dtype="float32")
+        if reference is None and backend == "torch":
+            reference = embeddings
+        if reference is not None:
+            cosine = (reference * embeddings).sum(axis=1) / (
+                np.linalg.norm(reference, axis=1) * np.linalg.norm(embeddings, axis=1)
+            )
+            min_cos = f"{cosine.min():>8.5f}"
+        else:
+            min_cos = f"{'n/a':>8}"
+        latencies = np.array(result["latencies"])
+        print(
+            f"{backend:<24} {result['import']:>9.2f} {result['load']:>7.2f} {result['first'] * 1e3:>9.1f} "
+            f"{np.percentile(latencies, 50) * 1e3:>7.2f} {np.percentile(latencies, 95) * 1e3:>7.2f} "
+            f"{len(latencies) / latencies.sum():>7.0f} {min_cos}"
+        )
+
+
+if __name__ == "__main__":
+    main()
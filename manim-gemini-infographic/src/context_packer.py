@@ -0,0 +1,110 @@
+"""
+Token-budgeted packing of retrieved chunks into prompt context.
+
+Candidates are re-ranked with maximal marginal relevance (MMR) so near-duplicate
+chunks don't crowd out other material, then taken greedily until the token
+budget is full. Consecutive chunks of the same page are merged back into one
+passage; words they repeat (e.g. from fixed-size overlapping windows) are kept
+once and only counted once against the budget. rag_retriever.retrieve_context is the entry point.
+"""
+
+import math
+
+import numpy as np
+
+CHARS_PER_TOKEN = 4   # rough average for English prose and code with Gemini/BERT-style tokenizers
+MAX_OVERLAP_WORDS = 400
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+def mmr_order(query_vec, vectors, diversity=0.3):
+    """Return candidate positions in MMR order.
+
+    Each step picks argmax of (1 - diversity) * sim(query, c) - diversity * max sim(c, selected).
+    Similarities are computed once as matrix products and the per-candidate
+    max-similarity-to-selected vector is updated in place, so a full ordering
+    costs O(n^2) vector ops rather than O(n^3) Python loops.
+    """
+    vectors = _normalize(vectors)
+    if not len(vectors):
+        return []
+    relevance = vectors @ _normalize(query_vec).ravel()
+    similarity = vectors @ vectors.T
+    closest = np.full(len(vectors), -np.inf, dtype="float32")
+    remaining = np.ones(len(vectors), dtype=bool)
+    order = []
+    for _ in range(len(vectors)):
+        penalty = np.where(np.isfinite(closest), closest, 0.0)
+        scores = np.where(remaining, (1 - diversity) * relevance - diversity * penalty, -np.inf)
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        remaining[pick] = False
+        np.maximum(closest, similarity[pick], out=closest)
+    return order
+
+
+def overlap_words(first, second):
+    """Length of the longest suffix of word list `first` that is a prefix of `second`."""
+    for size in range(min(len(first), len(second), MAX_OVERLAP_WORDS), 0, -1):
+        if first[-size:] == second[:size]:
+            return size
+    return 0
+
+
+def merge_windows(chunks):
+    """Merge (chunk_id, url, text) chunks into passages.
+
+    Chunks of the same URL with consecutive ids are joined, dropping the words
+    the second repeats from the first. Returns (url, first_id, text) per passage,
+    grouped by URL in the order URLs first appear and by id within a URL.
+    """
+    by_url = {}
+    for chunk_id, url, text in chunks:
+        by_url.setdefault(url, []).append((chunk_id, text))
+    passages = []
+    for url, members in by_url.items():
+        members.sort()
+        run_id, run_words, last_id = members[0][0], members[0][1].split(), members[0][0]
+        for chunk_id, text in members[1:]:
+            words = text.split()
+            if chunk_id == last_id + 1:
+                run_words.extend(words[overlap_words(run_words, words):])
+            else:
+                passages.append((url, run_id, " ".join(run_words)))
+                run_id, run_words = chunk_id, words
+            last_id = chunk_id
+        passages.append((url, run_id, " ".join(run_words)))
+    return passages
+
+
+def pack(query_vec, chunks, vectors, token_budget, diversity=0.3, count_tokens=estimate_tokens):
+    """Select chunks in MMR order until `token_budget` is used up and return merged (text, url) passages.
+
+    `chunks` are (chunk_id, url, text) tuples and `vectors` their embeddings.
+    A chunk adjacent to one already taken is charged only for the words it adds.
+    """
+    taken = {}
+    used = 0
+    for position in mmr_order(query_vec, vectors, diversity):
+        chunk_id, url, text = chunks[position]
+        words = text.split()
+        previous = taken.get((url, chunk_id - 1))
+        if previous is not None:
+            words = words[overlap_words(previous[2].split(), words):]
+        following = taken.get((url, chunk_id + 1))
+        if following is not None:
+            words = words[:len(words) - overlap_words(words, following[2].split())]
+        cost = count_tokens(" ".join(words)) if words else 0
+        if used + cost > token_budget:
+            continue
+        used += cost
+        taken[(url, chunk_id)] = chunks[position]
+    return [(text, url) for url, _, text in merge_windows(taken.values())]
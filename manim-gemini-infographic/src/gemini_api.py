@@ -1,20 +1,7 @@
-def get_manim_code(prompt):
+import gemini_client
 
-    import os
-    from dotenv import load_dotenv
-    import google.generativeai as genai
 
-    # Load .env file so environment variables are available
-    load_dotenv()
-
-    # Load API key from environment variable
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise Exception("GOOGLE_API_KEY environment variable not set.")
-    genai.configure(api_key=api_key)
-
-    # Create the Gemini model instance
-    model = genai.GenerativeModel("gemini-2.5-flash")
+def get_manim_code(prompt, stream_to=None, cache=True):
 
     # System prompt: role and output instructions
     system_prompt = (
@@ -32,18 +19,5 @@ def get_manim_code(prompt):
     )
 
     # Use Gemini's system_instruction argument for the system prompt
-    model_with_system = genai.GenerativeModel(
-        "gemini-2.5-flash",
-        system_instruction=system_prompt
-    )
-    response = model_with_system.generate_content(user_prompt)
-    manim_code = response.text.strip()
-    # Remove accidental markdown code blocks if present
-    if manim_code.startswith("```python"):
-        manim_code = manim_code[9:]
-    if manim_code.startswith("```"):
-        manim_code = manim_code[3:]
-    if manim_code.endswith("```"):
-        manim_code = manim_code[:-3]
-    manim_code = manim_code.strip()
-    return manim_code
\ No newline at end of file
+    manim_code = gemini_client.generate(user_prompt, system_prompt, out_path=stream_to, check=gemini_client.python_syntax_error, cache=cache)
+    return manim_code
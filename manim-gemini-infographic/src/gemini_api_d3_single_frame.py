@@ -1,17 +1,49 @@
-def get_d3_code_single_frame(prompt):
-    import os
-    from dotenv import load_dotenv
-    import google.generativeai as genai
+import time
 
-    # Load .env file so environment variables are available
-    load_dotenv()
+import gemini_client
+import static_checks
 
-    # Load API key from environment variable
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise Exception("GOOGLE_API_KEY environment variable not set.")
-    genai.configure(api_key=api_key)
 
+def _review_code(d3_code, stream_to=None, cache=True):
+    """Overlap review, then syntax review: each is a Gemini call made only when its local check in static_checks flags something."""
+    layout_issues = static_checks.d3_layout_issues(d3_code)
+    if static_checks.review_needed("overlap", layout_issues):
+        # Post-process: Ask Gemini to check for overlapping elements and fix them
+        post_system_instruction = (
+            "You are a D3.js expert and code reviewer. "
+            "Given a D3.js HTML+JS code for a single-frame infographic, "
+            "analyze the code for any overlapping or crowded text or elements. "
+            "If you find overlapping or crowded elements, fix the code by repositioning, resizing, "
+            "or removing some information as needed, but ensure the infographic remains clear, readable, "
+            "and still makes sense. "
+            "If you remove information, prioritize keeping the most important key concepts. "
+            "Return ONLY the fixed HTML+JS code, with no explanations or markdown. "
+        )
+        post_user_prompt = (
+            "Here is the D3.js code for a single-frame infographic. "
+            "Check for overlapping or crowded elements and fix them as needed. "
+            "If you must remove information, keep the most important key concepts. "
+            "Return only the fixed code.\n\n" + static_checks.issues_note(layout_issues) + d3_code
+        )
+        d3_code = gemini_client.generate(post_user_prompt, post_system_instruction, out_path=stream_to, cache=cache)
+
+    syntax_issues = static_checks.d3_syntax_issues(d3_code)
+    if static_checks.review_needed("syntax", syntax_issues):
+        # Second post-process: Ask Gemini to check and fix D3.js/HTML syntax errors
+        syntax_system_instruction = (
+            "You are a D3.js expert and code reviewer. "
+            "Given a D3.js HTML+JS code, check for any D3.js or HTML syntax errors or issues. "
+            "Fix all syntax errors and return ONLY the corrected HTML+JS code, with no explanations or markdown. "
+        )
+        syntax_user_prompt = (
+            "Here is the D3.js code. Check for any syntax errors and fix them. "
+            "Return only the corrected code.\n\n" + static_checks.issues_note(syntax_issues) + d3_code
+        )
+        d3_code = gemini_client.generate(syntax_user_prompt, syntax_system_instruction, out_path=stream_to, cache=cache)
+    return d3_code
+
+
+def get_d3_code_single_frame(prompt, stream_to=None, cache=True):
     # If prompt is a dict and has a 'task', branch logic
     if isinstance(prompt, dict) and 'task' in prompt:
         task = prompt['task'].lower()
@@ -33,20 +65,7 @@ def get_d3_code_single_frame(prompt):
                 f"Topic: {prompt.get('topic', '')}\n"
                 f"{prompt.get('task', '')}"
             )
-            model = genai.GenerativeModel(
-                "gemini-2.5-flash",
-                system_instruction=system_prompt
-            )
-            response = model.generate_content(user_prompt)
-            elements = response.text.strip()
-            # Remove accidental code blocks
-            if elements.startswith("```json"):
-                elements = elements[7:]
-            if elements.startswith("```"):
-                elements = elements[3:]
-            if elements.endswith("```"):
-                elements = elements[:-3]
-            elements = elements.strip()
+            elements = gemini_client.generate(user_prompt, system_prompt, validate=gemini_client.is_json_list)
             return elements
         elif 'code' in task:
             # Step 2: Generate code for the given elements
@@ -71,77 +90,8 @@ def get_d3_code_single_frame(prompt):
                 f"Elements: {prompt.get('elements', '')}\n"
                 f"{prompt.get('task', '')}"
             )
-            model_with_system = genai.GenerativeModel(
-                "gemini-2.5-flash",
-                system_instruction=system_prompt
-            )
-            response = model_with_system.generate_content(user_prompt)
-            d3_code = response.text.strip()
-            # Remove accidental markdown code blocks if present
-            if d3_code.startswith("```html"):
-                d3_code = d3_code[7:]
-            if d3_code.startswith("```"):
-                d3_code = d3_code[3:]
-            if d3_code.endswith("```"):
-                d3_code = d3_code[:-3]
-            d3_code = d3_code.strip()
-            # Post-process: Ask Gemini to check for overlapping elements and fix them
-            post_system_instruction = (
-                "You are a D3.js expert and code reviewer. "
-                "Given a D3.js HTML+JS code for a single-frame infographic, "
-                "analyze the code for any overlapping or crowded text or elements. "
-                "If you find overlapping or crowded elements, fix the code by repositioning, resizing, "
-                "or removing some information as needed, but ensure the infographic remains clear, readable, "
-                "and still makes sense. "
-                "If you remove information, prioritize keeping the most important key concepts. "
-                "Return ONLY the fixed HTML+JS code, with no explanations or markdown. "
-            )
-            post_user_prompt = (
-                "Here is the D3.js code for a single-frame infographic. "
-                "Check for overlapping or crowded elements and fix them as needed. "
-                "If you must remove information, keep the most important key concepts. "
-                "Return only the fixed code.\n\n" + d3_code
-            )
-            post_model_with_system = genai.GenerativeModel(
-                "gemini-2.5-flash",
-                system_instruction=post_system_instruction
-            )
-            post_response = post_model_with_system.generate_content(post_user_prompt)
-            fixed_code = post_response.text.strip()
-            # Remove accidental markdown code blocks if present
-            if fixed_code.startswith("```html"):
-                fixed_code = fixed_code[7:]
-            if fixed_code.startswith("```"):
-                fixed_code = fixed_code[3:]
-            if fixed_code.endswith("```"):
-                fixed_code = fixed_code[:-3]
-            fixed_code = fixed_code.strip()
-
-            # Second post-process: Ask Gemini to check and fix D3.js/HTML syntax errors
-            syntax_system_instruction = (
-                "You are a D3.js expert and code reviewer. "
-                "Given a D3.js HTML+JS code, check for any D3.js or HTML syntax errors or issues. "
-                "Fix all syntax errors and return ONLY the corrected HTML+JS code, with no explanations or markdown. "
-            )
-            syntax_user_prompt = (
-                "Here is the D3.js code. Check for any syntax errors and fix them. "
-                "Return only the corrected code.\n\n" + fixed_code
-            )
-            syntax_model_with_system = genai.GenerativeModel(
-                "gemini-2.5-flash",
-                system_instruction=syntax_system_instruction
-            )
-            syntax_response = syntax_model_with_system.generate_content(syntax_user_prompt)
-            syntax_fixed_code = syntax_response.text.strip()
-            # Remove accidental markdown code blocks if present
-            if syntax_fixed_code.startswith("```html"):
-                syntax_fixed_code = syntax_fixed_code[7:]
-            if syntax_fixed_code.startswith("```"):
-                syntax_fixed_code = syntax_fixed_code[3:]
-            if syntax_fixed_code.endswith("```"):
-                syntax_fixed_code = syntax_fixed_code[:-3]
-            syntax_fixed_code = syntax_fixed_code.strip()
-            return syntax_fixed_code
+            d3_code = gemini_client.generate(user_prompt, system_prompt, out_path=stream_to, cache=cache)
+            return _review_code(d3_code, stream_to, cache)
     # Fallback: legacy string prompt flow
     # ...existing code for legacy string prompt...
     system_prompt = (
@@ -166,74 +116,68 @@ def get_d3_code_single_frame(prompt):
         f"Do NOT try to explain in so much detail that the frame becomes crowded or unreadable. "
         f"Topic: {prompt}"
     )
-    model_with_system = genai.GenerativeModel(
-        "gemini-2.5-flash",
-        system_instruction=system_prompt
-    )
-    response = model_with_system.generate_content(user_prompt)
-    d3_code = response.text.strip()
-    # Remove accidental markdown code blocks if present
-    if d3_code.startswith("```html"):
-        d3_code = d3_code[7:]
-    if d3_code.startswith("```"):
-        d3_code = d3_code[3:]
-    if d3_code.endswith("```"):
-        d3_code = d3_code[:-3]
-    d3_code = d3_code.strip()
-    # Post-process: Ask Gemini to check for overlapping elements and fix them
-    post_system_instruction = (
-        "You are a D3.js expert and code reviewer. "
-        "Given a D3.js HTML+JS code for a single-frame infographic, "
-        "analyze the code for any overlapping or crowded text or elements. "
-        "If you find overlapping or crowded elements, fix the code by repositioning, resizing, "
-        "or removing some information as needed, but ensure the infographic remains clear, readable, "
-        "and still makes sense. "
-        "If you remove information, prioritize keeping the most important key concepts. "
-        "Return ONLY the fixed HTML+JS code, with no explanations or markdown. "
-    )
-    post_user_prompt = (
-        "Here is the D3.js code for a single-frame infographic. "
-        "Check for overlapping or crowded elements and fix them as needed. "
-        "If you must remove information, keep the most important key concepts. "
-        "Return only the fixed code.\n\n" + d3_code
-    )
-    post_model_with_system = genai.GenerativeModel(
-        "gemini-2.5-flash",
-        system_instruction=post_system_instruction
-    )
-    post_response = post_model_with_system.generate_content(post_user_prompt)
-    fixed_code = post_response.text.strip()
-    # Remove accidental markdown code blocks if present
-    if fixed_code.startswith("```html"):
-        fixed_code = fixed_code[7:]
-    if fixed_code.startswith("```"):
-        fixed_code = fixed_code[3:]
-    if fixed_code.endswith("```"):
-        fixed_code = fixed_code[:-3]
-    fixed_code = fixed_code.strip()
+    d3_code = gemini_client.generate(user_prompt, system_prompt, out_path=stream_to, cache=cache)
+    return _review_code(d3_code, stream_to, cache)
 
-    # Second post-process: Ask Gemini to check and fix D3.js/HTML syntax errors
-    syntax_system_instruction = (
-        "You are a D3.js expert and code reviewer. "
-        "Given a D3.js HTML+JS code, check for any D3.js or HTML syntax errors or issues. "
-        "Fix all syntax errors and return ONLY the corrected HTML+JS code, with no explanations or markdown. "
-    )
-    syntax_user_prompt = (
-        "Here is the D3.js code. Check for any syntax errors and fix them. "
-        "Return only the corrected code.\n\n" + fixed_code
+
+# {elements, code}: elements come first so the model plans the layout before writing code
+PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "elements": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "code": {"type": "STRING"},
+    },
+    "required": ["elements", "code"],
+    "property_ordering": ["elements", "code"],
+}
+
+
+def _usable_plan(plan):
+    """Whether a PLAN_SCHEMA reply has a non-empty elements list and some code."""
+    elements, code = (plan.get("elements"), plan.get("code")) if isinstance(plan, dict) else (None, None)
+    return isinstance(elements, list) and bool(elements) and isinstance(code, str) and bool(gemini_client.strip_fences(code))
+
+
+def get_d3_plan_and_code(prompt, stream_to=None):
+    """Elements list and D3.js page from one structured-output call, then the usual review passes.
+
+    `prompt` is the {"topic": ..., **options} dict of main_d3_single_frame.
+    Returns (elements, code), or None if the call fails or the reply is
+    unusable, so the caller can fall back to the two-step flow.
+    """
+    system_prompt = (
+        "You are a D3.js infographic designer and a D3.js expert who creates beautiful, informative, and highly readable single-frame infographics. "
+        "First choose the key D3.js elements (e.g., SVG, rect, text, circle, line, group, axis, etc.) needed to make a single-frame D3.js infographic for the topic, "
+        "then write the code using ONLY those elements. "
+        "The elements should be chosen to make the infographic as informative as possible, but must not crowd the screen and must not overlap. "
+        "Only include enough elements to fit one screen and be visually clear. "
+        "You must ONLY use valid D3.js (v7+) and SVG syntax and functions—do not use any syntax, classes, or methods that are not part of the official D3.js or SVG specification. "
+        "The code must be a complete HTML+JS page, with NO explanations, NO markdown, and NO ```html or ``` blocks. "
+        "The output must be a single static frame (no animation unless requested). "
+        "All information about the topic must be visible in that single frame. "
+        "Pay special attention to layout boundaries: No text or element should go outside the visible SVG area or overlap with other elements. "
+        "All text and diagram elements must be placed so that they fit within the SVG canvas, with appropriate padding from the edges. "
+        "If there is not enough space, reduce the number of elements or use ellipsis, but never let text go outside the canvas or overlap. "
+        "Return a JSON object with 'elements' (a list of element descriptions) and 'code' (the complete HTML page)."
     )
-    syntax_model_with_system = genai.GenerativeModel(
-        "gemini-2.5-flash",
-        system_instruction=syntax_system_instruction
+    options = {key: value for key, value in prompt.items() if key != "topic"}
+    user_prompt = (
+        f"Topic: {prompt.get('topic', '')}\n"
+        + (f"Options: {options}\n" if options else "")
+        + "List the key visual/text elements for a single-frame D3.js infographic on this topic, "
+        "then produce the D3.js (HTML+JS) code that uses ONLY those elements."
     )
-    syntax_response = syntax_model_with_system.generate_content(syntax_user_prompt)
-    syntax_fixed_code = syntax_response.text.strip()
-    # Remove accidental markdown code blocks if present
-    if syntax_fixed_code.startswith("```html"):
-        syntax_fixed_code = syntax_fixed_code[7:]
-    if syntax_fixed_code.startswith("```"):
-        syntax_fixed_code = syntax_fixed_code[3:]
-    if syntax_fixed_code.endswith("```"):
-        syntax_fixed_code = syntax_fixed_code[:-3]
-    syntax_fixed_code = syntax_fixed_code.strip()
-    return syntax_fixed_code
+    start = time.perf_counter()
+    try:
+        plan = gemini_client.generate_json(user_prompt, PLAN_SCHEMA, system_prompt, validate=_usable_plan)
+        if not _usable_plan(plan):
+            raise ValueError("reply has no elements or no code")
+        elements, d3_code = plan["elements"], gemini_client.strip_fences(plan["code"])
+    except Exception as e:
+        print(f"[WARN] Single-call elements+code generation failed, falling back to two steps: {e}")
+        return None
+    print(f"[INFO] Planned {len(elements)} elements and generated code in one call ({time.perf_counter() - start:.1f}s)")
+    if stream_to:
+        with open(stream_to, "w", encoding="utf-8") as f:
+            f.write(d3_code)
+    return elements, _review_code(d3_code, stream_to)
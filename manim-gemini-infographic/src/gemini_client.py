@@ -0,0 +1,474 @@
+"""
+Shared Gemini client for the code generation modules.
+
+The SDK is configured once per process (GOOGLE_API_KEY from the environment
+or .env) and GenerativeModel objects are cached per (model name, system
+instruction), so a multi-step generation builds each model once instead of on
+every call. `generate` and `send_message` are the only paths to the API: they
+strip the markdown fences models wrap code in and count calls, errors and
+latency in `call_stats()`, the one place to hook further instrumentation.
+
+Replies are also kept in a content-addressed on-disk cache, keyed by a hash of
+(model, system instruction, prompt or chat transcript, generation config).
+GEMINI_CACHE selects the mode:
+
+    on      answer repeated requests from the cache, call the API on a miss (default)
+    off     always call the API, never touch the cache
+    record  always call the API and (re)write the cache
+    replay  answer only from the cache; a miss raises CacheMissError and
+            no API key is needed, so recorded runs replay offline and deterministically
+
+Render-fix prompts pass `cache=False`: in mode "on" they always reach the API,
+since a cached fix is one a previous run already saw fail, but they are still
+recorded for replay.
+
+With GEMINI_STREAM=1 (or `stream=True`) replies are streamed: fences are
+stripped as chunks arrive, the code is written to `out_path` as it grows, time
+to first token and tokens/s are reported, and a `check` such as
+`python_syntax_error` can cut off a generation that is already broken.
+"""
+
+import codeop
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import warnings
+
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+API_KEY_ENV = "GOOGLE_API_KEY"
+CACHE_MODES = ("off", "on", "record", "replay")
+CACHE_MODE = os.getenv("GEMINI_CACHE", "on")
+CACHE_DIR = os.getenv("GEMINI_CACHE_DIR", "./llm_cache")
+CACHE_MAX_BYTES = int(float(os.getenv("GEMINI_CACHE_MAX_MB", "256")) * 1024 * 1024)  # least recently used go first
+STREAM = os.getenv("GEMINI_STREAM", "0") == "1"
+CHECK_EVERY_LINES = 10  # streamed lines between two runs of the early-abort check
+SINGLE_CALL = os.getenv("GEMINI_SINGLE_CALL", "1") == "1"  # plan elements and write code in one structured call
+
+_OPENING_FENCE = re.compile(r"```[\w+-]*[ \t]*\n")
+_lock = threading.Lock()
+_api_key = None
+_models = {}
+_stats = {"calls": 0, "errors": 0, "seconds": 0.0, "cache_hits": 0, "cache_misses": 0, "aborted": 0, "last_stream": None}
+
+
+class CacheMissError(RuntimeError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+class ResponseCache:
+    """Content-addressed reply store under `directory`, one JSON file per request.
+
+    Reading an entry bumps its mtime, and every write evicts the least
+    recently used entries until the cache fits in `max_bytes`. Entries are
+    written to a temp file and renamed, so concurrent processes can share it.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(model_name, system_instruction, contents, generation_config=None):
+        payload = json.dumps(
+            [model_name, system_instruction, contents, generation_config], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key, touch=True):
+        """Return the cached reply text, or None; `touch` marks it recently used."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["response"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        if touch:
+            try:
+                os.utime(path)
+            except OSError:
+                pass  # a read-only cache still serves hits, it just can't track recency
+        return text
+
+    def put(self, key, request, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"request": request, "response": text}, f, default=str)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def invalidate(self, key):
+        """Drop the entry for `key`, e.g. a reply its caller rejected."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith(".json"):
+                    try:
+                        st = os.stat(os.path.join(dirpath, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, os.path.join(dirpath, name)))
+                    total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_cache = ResponseCache()
+
+
+def set_cache_mode(mode):
+    """Switch the cache mode for this process, e.g. "replay" in tests."""
+    global CACHE_MODE
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode {mode!r}, expected one of {', '.join(CACHE_MODES)}")
+    CACHE_MODE = mode
+
+
+def configure(api_key=None):
+    """Configure the SDK, once; pass `api_key` to switch keys, which drops the cached models."""
+    global _api_key
+    if api_key is None and _api_key is not None:
+        return
+    import google.generativeai as genai
+
+    with _lock:
+        if api_key is None:
+            if _api_key is not None:
+                return
+            from dotenv import load_dotenv
+            load_dotenv()
+            api_key = os.getenv(API_KEY_ENV)
+            if not api_key:
+                raise Exception(f"{API_KEY_ENV} environment variable not set.")
+        if api_key != _api_key:
+            genai.configure(api_key=api_key)
+            _models.clear()
+            _api_key = api_key
+
+
+def get_model(system_instruction=None, model_name=DEFAULT_MODEL):
+    """Return the cached GenerativeModel for (model_name, system_instruction)."""
+    configure()
+    key = (model_name, system_instruction)
+    model = _models.get(key)
+    if model is None:
+        import google.generativeai as genai
+
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+    return model
+
+
+def strip_fences(text):
+    """Remove a markdown code fence (```python, ```html, ```json or bare ```) wrapped around a reply."""
+    text = text.strip()
+    match = _OPENING_FENCE.match(text)
+    if match:
+        text = text[match.end():]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+class FenceStripper:
+    """Incremental `strip_fences`: feed reply chunks, get back the text that is safe to emit.
+
+    The opening fence is dropped once its line is complete; trailing
+    whitespace and backticks are held back until more text follows them, since
+    they may be the closing fence. The concatenated output equals
+    `strip_fences` of the whole reply.
+    """
+
+    def __init__(self):
+        self._head = ""      # reply text until the opening fence is settled
+        self._tail = ""      # held-back whitespace and backticks
+        self._started = False
+        self._body = False   # some text after the opening fence has been seen
+
+    def feed(self, chunk):
+        if not self._started:
+            self._head += chunk
+            text = self._head.lstrip()
+            if not text or (text.startswith("```") and "\n" not in text) or (len(text) < 3 and "```".startswith(text)):
+                return ""
+            self._started = True
+            match = _OPENING_FENCE.match(text)
+            chunk = text[match.end():] if match else text[3:] if text.startswith("```") else text
+        if not self._tail and not self._body:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ""
+            self._body = True
+        text = self._tail + chunk
+        held = re.search(r"[\s`]*\Z", text).start()
+        self._tail = text[held:]
+        return text[:held]
+
+    def finish(self):
+        if not self._started:
+            return strip_fences(self._head)
+        tail = self._tail.rstrip()
+        if tail.endswith("```"):
+            tail = tail[:-3].rstrip()
+        self._tail = ""
+        return tail
+
+
+def python_syntax_error(code):
+    """Return the SyntaxError message if `code`, a prefix of a Python file, can no longer be completed; else None."""
+    # codeop reports a trailing backslash continuation as an unexpected EOF; check the lines before it
+    lines = code.splitlines(keepends=True)
+    while lines and lines[-1].rstrip("\r\n").endswith("\\"):
+        lines.pop()
+    code = "".join(lines)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            codeop.compile_command(code, "<generated>", "exec")
+    except (SyntaxError, ValueError, OverflowError) as e:
+        return str(e)
+    return None
+
+
+class _StreamAborted(Exception):
+    def __init__(self, text, reason):
+        super().__init__(reason)
+        self.text = text
+
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+
+def _call(send, request, fences, cache=True, validate=None):
+    """Answer `request` from the cache or with `send()`, per CACHE_MODE.
+
+    `send` returns the raw reply text. With `cache=False` mode "on" always
+    calls the API (the reply is still stored, so replay can serve it). A
+    reply `validate(reply)` rejects is returned but never stored, and is
+    dropped from the cache if it came from there (except in replay mode).
+    Returns (post-processed reply, whether it came from the cache).
+    """
+    if CACHE_MODE not in CACHE_MODES:
+        raise ValueError(f"Unknown GEMINI_CACHE mode {CACHE_MODE!r}, expected one of {', '.join(CACHE_MODES)}")
+    key = ResponseCache.key(*request) if CACHE_MODE != "off" else None
+    text = None
+    if CACHE_MODE == "replay" or (CACHE_MODE == "on" and cache):
+        # Replay never writes, so it leaves a possibly read-only cache (a fixture, a CI mount) untouched
+        text = _cache.get(key, touch=CACHE_MODE != "replay")
+    cached = text is not None
+    if cached:
+        _count("cache_hits")
+        reply = strip_fences(text) if fences else text.strip()
+        if validate and not validate(reply) and CACHE_MODE != "replay":
+            _cache.invalidate(key)
+    else:
+        if key is not None:
+            _count("cache_misses")
+        if CACHE_MODE == "replay":
+            raise CacheMissError(f"No recorded Gemini response for request {key} (GEMINI_CACHE=replay)")
+        start = time.perf_counter()
+        try:
+            text = send()
+        except _StreamAborted as e:
+            # Return what was generated so the caller's render/fix loop sees the error; never cache it
+            _count("aborted")
+            print(f"[WARN] Aborted streamed generation early: {e}")
+            return e.text, False
+        except Exception:
+            _count("errors")
+            raise
+        finally:
+            _count("calls")
+            _count("seconds", time.perf_counter() - start)
+        reply = strip_fences(text) if fences else text.strip()
+        if key is not None and (validate is None or validate(reply)):
+            _cache.put(key, request, text)
+    return reply, cached
+
+
+def _stream(response, fences, out_path, check):
+    """Consume a streamed response: write stripped text to `out_path` as it arrives and run `check`.
+
+    Returns the raw reply text; raises _StreamAborted when `check` reports an error.
+    """
+    start = time.perf_counter()
+    first = None
+    raw = []
+    emitted = []
+    checked_lines = 0
+    tokens = None
+    stripper = FenceStripper() if fences else None
+    out = open(out_path, "w", encoding="utf-8") if out_path else None
+    try:
+        for chunk in response:
+            text = chunk.text
+            if not text:
+                continue
+            if first is None:
+                first = time.perf_counter() - start
+            raw.append(text)
+            usage = getattr(chunk, "usage_metadata", None)
+            tokens = getattr(usage, "candidates_token_count", None) or tokens
+            piece = stripper.feed(text) if stripper else text
+            emitted.append(piece)
+            if out:
+                out.write(piece)
+                out.flush()
+            if check and "".join(emitted).count("\n") - checked_lines >= CHECK_EVERY_LINES:
+                code = "".join(emitted)
+                complete = code[:code.rfind("\n") + 1]
+                checked_lines = complete.count("\n")
+                error = check(complete)
+                if error:
+                    response_close = getattr(response, "close", None)
+                    if response_close:
+                        response_close()
+                    raise _StreamAborted(complete, error)
+        if stripper:
+            piece = stripper.finish()
+            emitted.append(piece)
+            if out:
+                out.write(piece)
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+    reply = "".join(raw)
+    tokens = tokens or max(1, len(reply) // 4)  # rough estimate if the API sent no usage metadata
+    rate = tokens / max(elapsed - (first or 0.0), 1e-9)
+    with _lock:
+        _stats["last_stream"] = {"ttft": first, "seconds": elapsed, "tokens": tokens, "tokens_per_s": rate}
+    print(f"[INFO] Streamed {tokens} tokens in {elapsed:.1f}s: first token after {first or 0.0:.2f}s, {rate:.1f} tokens/s")
+    return reply
+
+
+def generate(prompt, system_instruction=None, model_name=DEFAULT_MODEL, fences=True, generation_config=None,
+             stream=None, out_path=None, check=None, cache=True, validate=None):
+    """One generate_content call; returns the reply text, fence-stripped unless `fences=False`.
+
+    When streaming (`stream`, default GEMINI_STREAM) the stripped text is also
+    written to `out_path` as it arrives, and `check(code_so_far)` runs every
+    CHECK_EVERY_LINES lines: if it returns an error message the generation is
+    stopped and the code so far is returned uncached. A cached reply is
+    written to `out_path` in one go. Pass `cache=False` for repair prompts, so
+    a re-run asks the API again instead of replaying a fix that failed, and a
+    `validate(reply)` predicate to keep replies it rejects out of the cache.
+    """
+    stream = STREAM if stream is None else stream
+
+    def send():
+        model = get_model(system_instruction, model_name)
+        kwargs = {} if generation_config is None else {"generation_config": generation_config}
+        if not stream:
+            return model.generate_content(prompt, **kwargs).text
+        return _stream(model.generate_content(prompt, stream=True, **kwargs), fences, out_path, check)
+
+    text, cached = _call(send, (model_name, system_instruction, prompt, generation_config), fences, cache, validate)
+    if stream and out_path and cached:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
+
+
+def is_json_list(text):
+    """`validate` for replies that must be a JSON list, like the element lists of the two-step flows."""
+    try:
+        return isinstance(json.loads(text), list)
+    except ValueError:
+        return False
+
+
+def generate_json(prompt, schema, system_instruction=None, model_name=DEFAULT_MODEL, validate=None):
+    """One structured-output call: the reply is constrained to the JSON `schema` and returned parsed.
+
+    `schema` is a Gemini response schema, e.g. {"type": "OBJECT", "properties": {...}}.
+    Raises ValueError if the reply is not valid JSON. Invalid JSON, or a
+    parsed reply `validate(value)` rejects, is not kept in the cache.
+    """
+    config = {"response_mime_type": "application/json", "response_schema": schema}
+
+    def valid(text):
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return False
+        return validate is None or bool(validate(value))
+
+    text = generate(prompt, system_instruction, model_name, generation_config=config, stream=False, validate=valid)
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Gemini returned invalid JSON for a structured request: {e}") from e
+
+
+class Chat:
+    """A chat session whose turns are cached like `generate` calls, keyed by the whole transcript.
+
+    The SDK session is only opened when a turn misses the cache, seeded with
+    the turns answered so far, so a partly cached conversation keeps its context.
+    """
+
+    def __init__(self, system_instruction=None, model_name=DEFAULT_MODEL):
+        self.system_instruction = system_instruction
+        self.model_name = model_name
+        self.history = []  # [{"role": "user" | "model", "parts": [text]}]
+        self._session = None
+        self._session_turns = 0
+
+    def _send(self, message):
+        model = get_model(self.system_instruction, self.model_name)
+        if self._session is None or self._session_turns != len(self.history):
+            self._session = model.start_chat(history=list(self.history))
+        response = self._session.send_message(message)
+        self._session_turns = len(self.history) + 2
+        return response
+
+    def send_message(self, message, fences=True, cache=True):
+        transcript = self.history + [{"role": "user", "parts": [message]}]
+        request = (self.model_name, self.system_instruction, transcript)
+        reply, _ = _call(lambda: self._send(message).text, request, fences=False, cache=cache)
+        self.history = transcript + [{"role": "model", "parts": [reply]}]
+        return strip_fences(reply) if fences else reply
+
+
+def start_chat(system_instruction=None, model_name=DEFAULT_MODEL):
+    return Chat(system_instruction, model_name)
+
+
+def send_message(chat, message, fences=True, cache=True):
+    """Send a message in a chat session from `start_chat`; returns the reply like `generate`."""
+    return chat.send_message(message, fences, cache)
+
+
+def call_stats():
+    """API calls made, failed calls, seconds waiting on the API, response cache hits/misses and cached model count."""
+    with _lock:
+        return dict(_stats, models=len(_models))
@@ -1,6 +1,7 @@
 import os
 from gemini_api import get_manim_code
 from manim_render import render_manim_code
+from utils import save_generation
 
 def main():
     prompt = input("Enter your prompt for the Gemini API to generate Manim code: ")
@@ -9,7 +10,7 @@ def main():
     max_attempts = 10
     attempt = 0
     code_file = "generated_manim_code.py"
-    manim_code = get_manim_code(prompt)
+    manim_code = get_manim_code(prompt, stream_to=code_file)
 
     while attempt < max_attempts:
         with open(code_file, "w", encoding="utf-8") as f:
@@ -19,6 +20,7 @@ def main():
         print(f"Rendering the Manim code... (Attempt {attempt+1}/{max_attempts})")
         success, stdout, stderr = render_manim_code(code_file)
         if success:
+            save_generation(manim_code, prompt, ".py")
             break
         else:
             print("Attempting to fix code using Gemini API...")
@@ -40,7 +42,7 @@ def main():
                 f"{stderr}\n"
                 "Return ONLY the corrected Manim code."
             )
-            manim_code = fix_manim_code(error_prompt)
+            manim_code = fix_manim_code(error_prompt, stream_to=code_file, cache=False)
             attempt += 1
     else:
         print("Failed to render Manim code after 10 attempts.")
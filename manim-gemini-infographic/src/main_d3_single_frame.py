@@ -1,4 +1,6 @@
-from gemini_api_d3_single_frame import get_d3_code_single_frame
+import gemini_client
+from gemini_api_d3_single_frame import get_d3_code_single_frame, get_d3_plan_and_code
+from utils import save_generation
 
 def main():
     import json
@@ -15,38 +17,48 @@ def main():
     prompt_obj = {"topic": topic}
     prompt_obj.update(options)
 
-    # Step 1: Ask LLM for a concise list of elements for the infographic
-    from gemini_api_d3_single_frame import get_d3_code_single_frame as llm_call
-    print("Asking Gemini for a concise list of elements for the infographic...")
-    elements_prompt = {
-        "topic": topic,
-        "task": "List the key visual/text elements needed to make a single-frame D3.js infographic for this topic. Only include enough elements to fit one screen and be informative. Return as a JSON list of element descriptions. Do not include code or explanations."
-    }
-    elements_prompt.update(options)
-    elements_response = llm_call(elements_prompt)
-    try:
-        elements_list = json.loads(elements_response)
-        if not isinstance(elements_list, list):
-            raise ValueError("LLM did not return a JSON list.")
-    except Exception as e:
-        print(f"[ERROR] Could not parse elements list from LLM: {e}\nRaw response: {elements_response}")
-        return
-    print("Elements to use in infographic:")
-    for i, el in enumerate(elements_list, 1):
-        print(f"  {i}. {el}")
-
-    # Step 2: Ask LLM to generate D3.js code for those elements
-    print("Fetching D3.js code from Gemini API...")
-    code_prompt_obj = {
-        "topic": topic,
-        "elements": elements_list,
-        "task": "Produce D3.js (HTML+JS) code for a single-frame infographic using ONLY the provided elements. The code must fit one screen, be informative, and follow all previous rules."
-    }
-    code_prompt_obj.update(options)
     max_attempts = 10
     attempt = 0
     code_file = "generated_d3_code_single_frame.html"
-    d3_code = get_d3_code_single_frame(code_prompt_obj)
+    plan = None
+    if gemini_client.SINGLE_CALL:
+        print("Asking Gemini for the elements and the D3.js code in one call...")
+        plan = get_d3_plan_and_code(prompt_obj, stream_to=code_file)
+    if plan:
+        elements_list, d3_code = plan
+        print("Elements to use in infographic:")
+        for i, el in enumerate(elements_list, 1):
+            print(f"  {i}. {el}")
+    else:
+        # Step 1: Ask LLM for a concise list of elements for the infographic
+        from gemini_api_d3_single_frame import get_d3_code_single_frame as llm_call
+        print("Asking Gemini for a concise list of elements for the infographic...")
+        elements_prompt = {
+            "topic": topic,
+            "task": "List the key visual/text elements needed to make a single-frame D3.js infographic for this topic. Only include enough elements to fit one screen and be informative. Return as a JSON list of element descriptions. Do not include code or explanations."
+        }
+        elements_prompt.update(options)
+        elements_response = llm_call(elements_prompt)
+        try:
+            elements_list = json.loads(elements_response)
+            if not isinstance(elements_list, list):
+                raise ValueError("LLM did not return a JSON list.")
+        except Exception as e:
+            print(f"[ERROR] Could not parse elements list from LLM: {e}\nRaw response: {elements_response}")
+            return
+        print("Elements to use in infographic:")
+        for i, el in enumerate(elements_list, 1):
+            print(f"  {i}. {el}")
+
+        # Step 2: Ask LLM to generate D3.js code for those elements
+        print("Fetching D3.js code from Gemini API...")
+        code_prompt_obj = {
+            "topic": topic,
+            "elements": elements_list,
+            "task": "Produce D3.js (HTML+JS) code for a single-frame infographic using ONLY the provided elements. The code must fit one screen, be informative, and follow all previous rules."
+        }
+        code_prompt_obj.update(options)
+        d3_code = get_d3_code_single_frame(code_prompt_obj, stream_to=code_file)
 
     while attempt < max_attempts:
         with open(code_file, "w", encoding="utf-8") as f:
@@ -63,6 +75,7 @@ def main():
         # Ask user if the output looks correct
         user_feedback = input("Does the output look correct? (y/n): ").strip().lower()
         if user_feedback == 'y':
+            save_generation(d3_code, topic, ".html")
             # Export PNG automatically using the helper
             try:
                 from save_infographic_as_png import save_infographic_as_png
@@ -90,7 +103,7 @@ def main():
                 ]
             }
             error_prompt_obj.update(options)
-            d3_code = fix_d3_code(error_prompt_obj)
+            d3_code = fix_d3_code(error_prompt_obj, stream_to=code_file, cache=False)
             attempt += 1
     else:
         print("Failed to generate correct D3.js code after 5 attempts.")
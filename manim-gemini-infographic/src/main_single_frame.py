@@ -1,7 +1,9 @@
 
 
-from gemini_api_single_frame import get_manim_code_single_frame
+import gemini_client
+from gemini_api_single_frame import get_manim_code_single_frame, get_manim_plan_and_code
 from manim_render import render_manim_code
+from utils import save_generation
 
 def main():
     import json
@@ -18,39 +20,49 @@ def main():
     prompt_obj = {"topic": topic}
     prompt_obj.update(options)
 
-    # Step 1: Ask LLM for a concise list of elements for the infographic
-    from gemini_api_single_frame import get_manim_code_single_frame as llm_call
-    print("Asking Gemini for a concise list of elements for the infographic...")
-    elements_prompt = {
-        "topic": topic,
-        "task": "List the key visual/text elements needed to make a single-frame Manim infographic for this topic. Only include enough elements to fit one screen and be informative. Return as a JSON list of element descriptions. Do not include code or explanations."
-    }
-    elements_prompt.update(options)
-    elements_response = llm_call(elements_prompt)
-    try:
-        import json
-        elements_list = json.loads(elements_response)
-        if not isinstance(elements_list, list):
-            raise ValueError("LLM did not return a JSON list.")
-    except Exception as e:
-        print(f"[ERROR] Could not parse elements list from LLM: {e}\nRaw response: {elements_response}")
-        return
-    print("Elements to use in infographic:")
-    for i, el in enumerate(elements_list, 1):
-        print(f"  {i}. {el}")
-
-    # Step 2: Ask LLM to generate Manim code for those elements
-    print("Fetching Manim code from Gemini API...")
-    code_prompt_obj = {
-        "topic": topic,
-        "elements": elements_list,
-        "task": "Produce Manim Community Edition code for a single-frame infographic using ONLY the provided elements. The code must fit one screen, be informative, and follow all previous rules."
-    }
-    code_prompt_obj.update(options)
     max_attempts = 10
     attempt = 0
     code_file = "generated_manim_code_single_frame.py"
-    manim_code = get_manim_code_single_frame(code_prompt_obj)
+    plan = None
+    if gemini_client.SINGLE_CALL:
+        print("Asking Gemini for the elements and the Manim code in one call...")
+        plan = get_manim_plan_and_code(prompt_obj, stream_to=code_file)
+    if plan:
+        elements_list, manim_code = plan
+        print("Elements to use in infographic:")
+        for i, el in enumerate(elements_list, 1):
+            print(f"  {i}. {el}")
+    else:
+        # Step 1: Ask LLM for a concise list of elements for the infographic
+        from gemini_api_single_frame import get_manim_code_single_frame as llm_call
+        print("Asking Gemini for a concise list of elements for the infographic...")
+        elements_prompt = {
+            "topic": topic,
+            "task": "List the key visual/text elements needed to make a single-frame Manim infographic for this topic. Only include enough elements to fit one screen and be informative. Return as a JSON list of element descriptions. Do not include code or explanations."
+        }
+        elements_prompt.update(options)
+        elements_response = llm_call(elements_prompt)
+        try:
+            import json
+            elements_list = json.loads(elements_response)
+            if not isinstance(elements_list, list):
+                raise ValueError("LLM did not return a JSON list.")
+        except Exception as e:
+            print(f"[ERROR] Could not parse elements list from LLM: {e}\nRaw response: {elements_response}")
+            return
+        print("Elements to use in infographic:")
+        for i, el in enumerate(elements_list, 1):
+            print(f"  {i}. {el}")
+
+        # Step 2: Ask LLM to generate Manim code for those elements
+        print("Fetching Manim code from Gemini API...")
+        code_prompt_obj = {
+            "topic": topic,
+            "elements": elements_list,
+            "task": "Produce Manim Community Edition code for a single-frame infographic using ONLY the provided elements. The code must fit one screen, be informative, and follow all previous rules."
+        }
+        code_prompt_obj.update(options)
+        manim_code = get_manim_code_single_frame(code_prompt_obj, stream_to=code_file)
 
     while attempt < max_attempts:
         with open(code_file, "w", encoding="utf-8") as f:
@@ -60,6 +72,7 @@ def main():
         print(f"Rendering the Manim code... (Attempt {attempt+1}/{max_attempts})")
         success, stdout, stderr = render_manim_code(code_file, still_image=True)
         if success:
+            save_generation(manim_code, topic, ".py")
             break
         else:
             print("Attempting to fix code using Gemini API...")
@@ -80,7 +93,7 @@ def main():
                 ]
             }
             error_prompt_obj.update(options)
-            manim_code = fix_manim_code(error_prompt_obj)
+            manim_code = fix_manim_code(error_prompt_obj, stream_to=code_file, cache=False)
             attempt += 1
     else:
         print("Failed to render Manim code after 5 attempts.")
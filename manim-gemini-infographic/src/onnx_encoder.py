@@ -0,0 +1,184 @@
+"""
+ONNX Runtime query encoder, a lighter drop-in for the PyTorch SentenceTransformer.
+
+`export` writes the model's transformer to ONNX (optionally also an int8
+dynamically-quantized copy), its tokenizer and the pooling settings, then checks
+that the exported model reproduces the PyTorch embeddings. OnnxEncoder needs
+only onnxruntime, tokenizers and numpy at query time, so processes using it
+never import torch. rag_retriever uses it when RAG_ENCODER_BACKEND=onnx.
+
+Usage:
+    python src/onnx_encoder.py export --quantize   # writes ./manim_rag_db/onnx_encoder
+    python src/onnx_encoder.py check --model-file model.int8.onnx
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+ONNX_DIR = os.getenv("RAG_ONNX_DIR", "./manim_rag_db/onnx_encoder")
+ONNX_MODEL_FILE = os.getenv("RAG_ONNX_MODEL", "model.onnx")  # or model.int8.onnx after `export --quantize`
+ONNX_THREADS = int(os.getenv("RAG_ONNX_THREADS", "0"))       # 0 lets onnxruntime decide
+CONFIG_NAME = "encoder_config.json"
+QUANTIZED_FILE = "model.int8.onnx"
+MIN_COSINE = 0.99  # worst per-query cosine to the PyTorch embedding an exported model must reach
+
+# Encoded by `check`: the kind of text the retriever embeds at query time
+CHECK_TEXTS = [
+    "Axes get_graph",
+    "VGroup arrange",
+    "get_riemann_rectangles",
+    "how to animate a transformation between two shapes",
+    "add coordinate labels to a number plane",
+    "write text on screen with a fade in",
+    "plot a parametric function",
+    "change the color of a mobject",
+    "move the camera in a 3D scene",
+    "MathTex with multiple parts",
+    "derivative tangent line animation",
+    "ValueTracker always_redraw",
+]
+
+
+class OnnxEncoder:
+    """Tokenize, run the exported transformer and pool, matching SentenceTransformer.encode."""
+
+    def __init__(self, model_dir=ONNX_DIR, model_file=ONNX_MODEL_FILE, threads=ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_NAME), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, texts, batch_size=32):
+        """Return a float32 (len(texts), dim) array."""
+        texts = list(texts)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype="int64"),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype="int64"),
+            }
+            hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+            if self.config["pooling"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                weights = mask[:, :, None].astype("float32")
+                pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            if self.config["normalize"]:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype("float32"))
+        return np.vstack(batches) if batches else np.zeros((0, 0), dtype="float32")
+
+
+def export(model_name, out_dir=ONNX_DIR, quantize=False, opset=17):
+    """Export `model_name` to `out_dir`; returns the written model file names."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling_module = next(m for m in model if type(m).__name__ == "Pooling")
+    # sentence-transformers renamed get_pooling_mode_str() to a pooling_mode attribute
+    pooling = getattr(pooling_module, "pooling_mode", None) or pooling_module.get_pooling_mode_str()
+    if isinstance(pooling, (list, tuple)) and len(pooling) == 1:
+        pooling = pooling[0]
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode {pooling!r} for ONNX export")
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _HiddenStates(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(out_dir, exist_ok=True)
+    torch.onnx.export(
+        _HiddenStates(transformer.auto_model.eval()),
+        tuple(sample[name] for name in input_names),
+        os.path.join(out_dir, "model.onnx"),
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+        opset_version=opset,
+        dynamo=False,
+    )
+    files = ["model.onnx"]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(out_dir, "model.onnx"), os.path.join(out_dir, QUANTIZED_FILE), weight_type=QuantType.QInt8)
+        files.append(QUANTIZED_FILE)
+    tokenizer.save_pretrained(out_dir)
+    config = {
+        "model_name": model_name,
+        "max_seq_length": model.get_max_seq_length() or tokenizer.model_max_length,
+        "pooling": pooling,
+        "normalize": any(type(m).__name__ == "Normalize" for m in model),
+        "pad_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+    }
+    with open(os.path.join(out_dir, CONFIG_NAME), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=1)
+    return files
+
+
+def check(model_name, out_dir=ONNX_DIR, model_file=ONNX_MODEL_FILE, texts=CHECK_TEXTS):
+    """Return the worst cosine similarity between ONNX and PyTorch embeddings of `texts`."""
+    from sentence_transformers import SentenceTransformer
+
+    reference = np.asarray(SentenceTransformer(model_name, device="cpu").encode(texts), dtype="float32")
+    exported = OnnxEncoder(out_dir, model_file).encode(texts)
+    cosine = (reference * exported).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(exported, axis=1)
+    )
+    return float(cosine.min())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the query encoder to ONNX and check it against PyTorch")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--out-dir", default=ONNX_DIR)
+    parser.add_argument("--model-file", help="Model to check (default: every file the export wrote)")
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 dynamically quantized model")
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        files = export(args.model, args.out_dir, args.quantize)
+        print(f"[INFO] Exported {', '.join(files)} to {args.out_dir}")
+    else:
+        files = [ONNX_MODEL_FILE]
+    if args.model_file:
+        files = [args.model_file]
+    failed = False
+    for model_file in files:
+        worst = check(args.model, args.out_dir, model_file)
+        ok = worst >= args.min_cosine
+        failed = failed or not ok
+        print(f"[{'OK' if ok else 'FAIL'}] {model_file}: min cosine to PyTorch {worst:.5f} (need >= {args.min_cosine})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Drop-in replacement for rag_retriever that asks the shared rag_server daemon.
+
+    from rag_client import retrieve_relevant_docs
+
+If the daemon is not reachable and RAG_SERVER_FALLBACK is on (the default),
+calls fall back to an in-process rag_retriever, which loads its own model.
+"""
+
+import os
+import threading
+
+import requests
+
+RAG_SERVER_URL = os.getenv("RAG_SERVER_URL", "http://127.0.0.1:8765")
+RAG_SERVER_TIMEOUT = (1, 30)  # connect, read
+RAG_SERVER_FALLBACK = os.getenv("RAG_SERVER_FALLBACK", "1") == "1"
+
+_local = threading.local()
+_warned = False
+
+
+def _session():
+    # One keep-alive session per thread; requests sessions are not safe to share across threads
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def retrieve_relevant_docs_batch(queries, top_k=5, shards=None):
+    """Same as rag_retriever.retrieve_relevant_docs_batch, answered by the daemon."""
+    global _warned
+    queries = list(queries)
+    if not queries:
+        return []
+    try:
+        response = _session().post(
+            f"{RAG_SERVER_URL}/retrieve", json={"queries": queries, "top_k": top_k, "shards": list(shards or [])},
+            timeout=RAG_SERVER_TIMEOUT,
+        )
+        response.raise_for_status()
+    except requests.ConnectionError:
+        if not RAG_SERVER_FALLBACK:
+            raise
+        if not _warned:
+            print(f"[WARN] RAG server at {RAG_SERVER_URL} is not reachable, retrieving in-process")
+            _warned = True
+        import rag_retriever
+        return rag_retriever.retrieve_relevant_docs_batch(queries, top_k, shards)
+    return [[tuple(hit) for hit in hits] for hits in response.json()["results"]]
+
+
+def retrieve_relevant_docs(query, top_k=5, shards=None):
+    """Same as rag_retriever.retrieve_relevant_docs, answered by the daemon."""
+    return [(text, url) for text, url, _ in retrieve_relevant_docs_batch([query], top_k, shards)[0]]
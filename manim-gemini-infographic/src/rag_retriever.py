@@ -1,37 +1,572 @@
-import pickle
+import heapq
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-INDEX_PATH = "./manim_rag_db/manim_faiss.index"
-CHUNKS_PATH = "./manim_rag_db/manim_chunks.pkl"
-METADATA_PATH = "./manim_rag_db/manim_metadata.pkl"
+import context_packer
+
+# The chunk store and lexical index formats are defined next to rag_setup, which writes them
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from chunk_store import RECORD_DTYPE  # noqa: E402
+from lexical_index import POSTING_DTYPE, tokenize as _tokenize  # noqa: E402
+
+RAG_DB_DIR = "./manim_rag_db"
+SHARDS_DIR = os.path.join(RAG_DB_DIR, "shards")  # <shard>/CURRENT names the live <shard>/versions/<v>, see rag_setup
+DEFAULT_SHARD = "manim_ce"
+# Shards searched when a call doesn't route (manim_ce, manimlib, d3, generations), comma separated
+DEFAULT_SHARDS = tuple(name for name in os.getenv("RAG_SHARDS", DEFAULT_SHARD).split(",") if name)
+INDEX_NAME = "manim_faiss.index"
+INDEX_CONFIG_NAME = "manim_index_config.json"
+CHUNKS_BLOB_NAME = "manim_chunks.bin"
+CHUNKS_RECORDS_NAME = "manim_chunks.idx"
+URLS_NAME = "manim_urls.json"
+LEXICAL_TERMS_NAME = "manim_lexical.json"
+LEXICAL_POSTINGS_NAME = "manim_lexical.bin"
 EMBED_MODEL = "all-MiniLM-L6-v2"
+ENCODER_BACKEND = os.getenv("RAG_ENCODER_BACKEND", "torch")  # torch, or onnx (see onnx_encoder.py)
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))    # query embeddings kept, 0 disables
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))  # (version, query, top_k) results kept, 0 disables
+CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "0"))                   # seconds, 0 keeps entries until evicted
+# auto: symbol lookups from the lexical index, everything else dense; hybrid: symbol lookups
+# lexical, everything else dense and lexical fused by reciprocal rank; dense: always dense
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "auto")
+RRF_K = 60                 # reciprocal rank fusion constant
+HYBRID_CANDIDATES = 50     # hits taken from each ranking before fusing
+
+_SYMBOL_TOKEN = re.compile(r"[A-Za-z_][A-Za-z0-9_.]*(\(\))?")
 
 _model = None
-_index = None
-_chunks = None
-_metadata = None
+_shards = {}
+_missing_shards = set()  # shards already warned about as not built
+_load_lock = threading.RLock()
+_timings = {}
+
+
+class _LRUCache:
+    """Thread-safe LRU mapping with an optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize, ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_query_cache = _LRUCache(QUERY_CACHE_SIZE, CACHE_TTL)
+_result_cache = _LRUCache(RESULT_CACHE_SIZE, CACHE_TTL)
+
+
+class _ChunkStore:
+    """Read-only, memory-mapped view of the chunk store written by rag_setup.
+
+    Opening it costs a few syscalls; chunk text is only decoded for the ids
+    asked for, and the mapped pages are shared by every process on the host.
+    """
+
+    def __init__(self, blob_path, records_path, urls_path):
+        with open(urls_path, "r", encoding="utf-8") as f:
+            self.urls = json.load(f)
+        if os.path.getsize(records_path):
+            self.records = np.memmap(records_path, dtype=RECORD_DTYPE, mode="r")
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.ids = self.records["id"]
+        with open(blob_path, "rb") as f:
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, chunk_id):
+        """Return (text, url) for a chunk id, or None if the store doesn't have it."""
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row >= len(self.ids) or self.ids[row] != chunk_id:
+            return None
+        record = self.records[row]
+        offset = int(record["offset"])
+        text = self.blob[offset:offset + int(record["length"])].decode("utf-8")
+        return text, self.urls[record["url"]]
+
+
+class _LexicalIndex:
+    """Memory-mapped BM25 index written by rag_setup (see lexical_index.py).
+
+    Missing files give an empty index, so every query falls back to dense search.
+    """
+
+    def __init__(self, terms_path, postings_path):
+        self.terms = {}
+        self.postings = np.zeros(0, dtype=POSTING_DTYPE)
+        if os.path.exists(terms_path) and os.path.exists(postings_path):
+            with open(terms_path, "r", encoding="utf-8") as f:
+                self.terms = json.load(f)["terms"]
+            if os.path.getsize(postings_path):
+                self.postings = np.memmap(postings_path, dtype=POSTING_DTYPE, mode="r")
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def search(self, terms, top_k):
+        """Return up to top_k (chunk_id, bm25_score) pairs, best first."""
+        slices = []
+        for term in dict.fromkeys(terms):
+            if term in self.terms:
+                offset, count = self.terms[term]
+                slices.append(self.postings[offset:offset + count])
+        if not slices:
+            return []
+        if len(slices) == 1:
+            ids, scores = slices[0]["id"], slices[0]["weight"]
+        else:
+            postings = np.concatenate(slices)
+            ids, inverse = np.unique(postings["id"], return_inverse=True)
+            scores = np.bincount(inverse, weights=postings["weight"])
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def _looks_like_identifier(word):
+    """snake_case, dotted and called names, and CamelCase with an internal hump (VGroup, MathTex), but not "Circle"."""
+    return "_" in word or "." in word or word.endswith("()") or any(c.isupper() for c in word[1:])
+
+
+def _is_symbol_query(query, lexical):
+    """True for short API lookups like "Axes get_graph" whose terms all occur in the corpus.
+
+    Capitalized prose ("Create a Circle") is not a lookup and goes to dense search.
+    """
+    words = query.split()
+    if not 1 <= len(words) <= 4 or not all(_SYMBOL_TOKEN.fullmatch(w) for w in words):
+        return False
+    if not any(_looks_like_identifier(w) for w in words):
+        return False
+    return all(term in lexical for term in _tokenize(query))
+
+
+def _read_index(index_path, config_path):
+    """Read the index and apply the query-time parameters rag_setup stored with it.
+
+    Returns (index, config); the config also says whether queries must be normalized.
+    """
+    index = faiss.read_index(index_path)
+    config = {"type": "flat", "params": {"metric": "l2"}}
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    params = config["params"]
+    if config["type"] in ("ivf_flat", "ivf_pq"):
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", params["nprobe"])
+        # Lets retrieve_context reconstruct chunk vectors by id
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    elif config["type"] == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", params["ef_search"])
+    return index, config
+
+
+def _prepare_queries(embeddings, index_config):
+    embeddings = np.array(embeddings, dtype="float32")
+    if index_config["params"].get("metric") == "cosine":
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def _timed(phase, load):
+    start = time.perf_counter()
+    value = load()
+    _timings[phase] = time.perf_counter() - start
+    return value
+
+
+class _Version:
+    """One published build: its chunk store and lexical index, and its FAISS index once a query needs it."""
+
+    def __init__(self, name, directory):
+        self.name = name
+        self.directory = directory
+        blob, records, urls, terms, postings = (os.path.join(directory, file_name) for file_name in (
+            CHUNKS_BLOB_NAME, CHUNKS_RECORDS_NAME, URLS_NAME, LEXICAL_TERMS_NAME, LEXICAL_POSTINGS_NAME
+        ))
+        self.store = _timed("chunk_store", lambda: _ChunkStore(blob, records, urls))
+        self.lexical = _timed("lexical_index", lambda: _LexicalIndex(terms, postings))
+        self.index = None
+        self.index_config = None
+        self._lock = threading.Lock()
+
+    def dense(self):
+        """Read the FAISS index once; returns (index, index_config)."""
+        if self.index is None:
+            with self._lock:
+                if self.index is None:
+                    index, self.index_config = _timed("faiss_index", lambda: _read_index(
+                        os.path.join(self.directory, INDEX_NAME), os.path.join(self.directory, INDEX_CONFIG_NAME)
+                    ))
+                    self.index = index
+        return self.index, self.index_config
+
 
+class _Shard:
+    """A named index shard, loaded on first use and hot-swapped when rag_setup publishes a new version."""
 
-def _load_resources():
-    global _model, _index, _chunks, _metadata
+    def __init__(self, name):
+        self.name = name
+        self.root = os.path.join(SHARDS_DIR, name)
+        self.version = None
+        self._stamp = None     # (inode, mtime, size) of CURRENT when the version was chosen
+        self._swapping = False
+        self._lock = threading.RLock()
+
+    def _stat_current(self):
+        try:
+            st = os.stat(os.path.join(self.root, "CURRENT"))
+            # publish_version renames a new file over CURRENT, so the inode changes on every swap even
+            # when the mtime doesn't (coarse timestamps) and the size doesn't (same-length names)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _resolve(self):
+        """(name, directory) of the version CURRENT names, or None if the shard has not been built.
+
+        The default shard falls back to a build made before shards (or before
+        versioning) directly in RAG_DB_DIR; updates to that layout are only
+        picked up on restart.
+        """
+        roots = [self.root] + ([RAG_DB_DIR] if self.name == DEFAULT_SHARD else [])
+        for root in roots:
+            try:
+                with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+                    name = f.read().strip()
+                return f"{self.name}/{name}", os.path.join(root, "versions", name)
+            except FileNotFoundError:
+                pass
+        if self.name == DEFAULT_SHARD and os.path.exists(os.path.join(RAG_DB_DIR, URLS_NAME)):
+            return self.name, RAG_DB_DIR
+        return None
+
+    def _swap_in(self, name, directory, preload_dense):
+        """Load a version beside the live one, then make it live.
+
+        Queries keep being answered from the old version meanwhile. Those already
+        running hold their own reference to it, so it is released (and its files
+        unmapped) when the last of them returns.
+        """
+        try:
+            version = _Version(name, directory)
+            if preload_dense:
+                version.dense()
+            with self._lock:
+                self.version = version
+            # Results are keyed by version, so this only frees the old version's entries
+            _result_cache.clear()
+            print(f"[INFO] Swapped in RAG index version {name}")
+        except Exception as e:
+            print(f"[WARN] Could not load RAG index version {name}, still serving {self.version.name}: {e}")
+        finally:
+            self._swapping = False
+
+    def load(self):
+        """Return the live _Version (None if the shard has not been built), picking up a newly published build.
+
+        The first load happens in the caller. Later versions are loaded by a
+        background thread while queries go on against the old one, unless the old
+        one never read its FAISS index: then opening the new chunk store and
+        lexical index is all there is to do, and the caller does it. Callers keep
+        the returned version rather than reading the attribute again, so a swap
+        can't change it mid-query.
+        """
+        stamp = self._stat_current()
+        version = self.version
+        if version is not None and stamp == self._stamp:
+            return version
+        with self._lock:
+            if self._swapping or (self.version is not None and stamp == self._stamp):
+                return self.version
+            self._stamp = stamp
+            resolved = self._resolve()
+            if resolved is None:
+                return self.version
+            name, directory = resolved
+            if self.version is None:
+                self.version = _Version(name, directory)
+            elif name != self.version.name:
+                self._swapping = True
+                if self.version.index is None:
+                    self._swap_in(name, directory, preload_dense=False)
+                else:
+                    threading.Thread(
+                        target=self._swap_in, args=(name, directory, True), name=f"rag-swap-{self.name}", daemon=True
+                    ).start()
+            return self.version
+
+
+def _load_versions(shards=None):
+    """Return [(shard name, _Version)] for the built shards among `shards` (default: DEFAULT_SHARDS)."""
+    names = tuple(shards or DEFAULT_SHARDS)
+    loaded = []
+    for name in names:
+        shard = _shards.get(name)
+        if shard is None:
+            with _load_lock:
+                shard = _shards.setdefault(name, _Shard(name))
+        version = shard.load()
+        if version is not None:
+            loaded.append((name, version))
+        elif name not in _missing_shards:
+            _missing_shards.add(name)
+            print(f"[WARN] RAG shard {name!r} has not been built, skipping it")
+    if not loaded:
+        raise FileNotFoundError(f"No RAG index built for shards {', '.join(names)} under {RAG_DB_DIR}")
+    return loaded
+
+
+def _load_model():
+    # Imported here so processes that only do symbol lookups, or use ONNX, never pay for torch
+    if ENCODER_BACKEND == "onnx":
+        from onnx_encoder import OnnxEncoder
+        return OnnxEncoder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBED_MODEL)
+
+
+def _get_model():
+    """Load the query encoder once; it is shared by every shard."""
+    global _model
     if _model is None:
-        _model = SentenceTransformer(EMBED_MODEL)
-    if _index is None:
-        _index = faiss.read_index(INDEX_PATH)
-    if _chunks is None:
-        with open(CHUNKS_PATH, "rb") as f:
-            _chunks = pickle.load(f)
-    if _metadata is None:
-        with open(METADATA_PATH, "rb") as f:
-            _metadata = pickle.load(f)
-
-
-def retrieve_relevant_docs(query, top_k=5):
-    """Retrieve top_k relevant documentation chunks for the query."""
-    _load_resources()
-    query_emb = _model.encode([query])
-    distances, indices = _index.search(np.array(query_emb), top_k)
-    results = [(_chunks[i], _metadata[i]) for i in indices[0]]
-    return results 
\ No newline at end of file
+        with _load_lock:
+            if _model is None:
+                _model = _timed("model", _load_model)
+    return _model
+
+
+def load_timings():
+    """Seconds spent in each load phase so far (model, faiss_index, chunk_store, lexical_index, warmup_encode)."""
+    return dict(_timings)
+
+
+def warmup(background=False, dense=True, shards=None):
+    """Load everything retrieval on `shards` (default: DEFAULT_SHARDS) needs before the first query arrives.
+
+    With `background=True` the work runs in a daemon thread, which is returned;
+    queries issued meanwhile simply wait on the load locks. `dense=False` only
+    opens the chunk stores and lexical indexes. A dummy encode runs the model's
+    lazy initialization so the first real query doesn't pay for it.
+    """
+    if background:
+        thread = threading.Thread(
+            target=warmup, kwargs={"dense": dense, "shards": shards}, name="rag-warmup", daemon=True
+        )
+        thread.start()
+        return thread
+    versions = _load_versions(shards)
+    if dense:
+        for _, version in versions:
+            version.dense()
+        model = _get_model()
+        _timed("warmup_encode", lambda: model.encode(["warmup"]))
+    return load_timings()
+
+
+def _encode_queries(queries, model):
+    """Embed queries, calling the model once for all of those not in the query cache."""
+    embeddings = [_query_cache.get(query) for query in queries]
+    missing = list(dict.fromkeys(q for q, emb in zip(queries, embeddings) if emb is None))
+    if missing:
+        encoded = dict(zip(missing, model.encode(missing)))
+        for query, emb in encoded.items():
+            _query_cache.put(query, emb)
+        embeddings = [encoded[q] if emb is None else emb for q, emb in zip(queries, embeddings)]
+    return np.array(embeddings, dtype="float32")
+
+
+def cache_stats():
+    """Hit/miss counters and sizes of the query-embedding and result caches."""
+    return {"queries": _query_cache.stats(), "results": _result_cache.stats()}
+
+
+def clear_caches():
+    _query_cache.clear()
+    _result_cache.clear()
+
+
+def _dense_search(versions, queries, top_k):
+    """Encode the queries once and search every version's index.
+
+    Returns, per version, one list of (chunk_id, distance) per query.
+    """
+    embeddings = _encode_queries(queries, _get_model())
+    found = []
+    for version in versions:
+        index, index_config = version.dense()
+        distances, indices = index.search(_prepare_queries(embeddings, index_config), top_k)
+        # The index is ID-mapped: hits are chunk ids in the store, -1 pads short results
+        found.append([
+            [(int(i), float(d)) for d, i in zip(row_distances, row_indices) if i != -1]
+            for row_distances, row_indices in zip(distances, indices)
+        ])
+    return found
+
+
+def _similarity(distance, index_config):
+    """Map a FAISS distance to a larger-is-closer score comparable across shards.
+
+    Squared L2 between unit vectors (what the sentence encoder produces) is
+    2 - 2 * cosine, so both metrics end up on the cosine scale.
+    """
+    if index_config["params"].get("metric") == "cosine":
+        return distance
+    return 1.0 - distance / 2.0
+
+
+def _fuse(rankings, top_k):
+    """Reciprocal rank fusion of several (chunk_id, score) rankings."""
+    scores = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+
+
+def retrieve_relevant_docs_batch(queries, top_k=5, shards=None):
+    """Retrieve top_k chunks for each query with at most one encode and one search per shard.
+
+    `shards` routes the search (e.g. ["manimlib"] for 3Blue1Brown code,
+    ["manim_ce", "generations"]); it defaults to DEFAULT_SHARDS. Hits from
+    several shards are merged by score (by rank for symbol lookups). Returns
+    one list per query of (text, url, score) tuples, best first. The score
+    depends on how the query was answered: the FAISS distance for dense hits
+    (squared L2, smaller is closer; inner product for the cosine metric,
+    larger is closer), the BM25 score for symbol lookups served by the
+    lexical indexes, or the fused reciprocal rank score in hybrid mode.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    versions = _load_versions(shards)
+    cache_key = tuple(version.name for _, version in versions)
+    results = [_result_cache.get((cache_key, query, top_k)) for query in queries]
+    pending = list(dict.fromkeys(q for q, hits in zip(queries, results) if hits is None))
+    if pending:
+        ranked = {query: [] for query in pending}  # (merge score, version, chunk_id, score)
+        dense = []
+        for query in pending:
+            # A symbol lookup only searches the shards that define every term of it
+            lexical = [v for _, v in versions if RETRIEVAL_MODE != "dense" and _is_symbol_query(query, v.lexical)]
+            for version in lexical:
+                # Raw BM25 scores of different corpora don't compare: merge shards by reciprocal rank
+                hits = version.lexical.search(_tokenize(query), top_k)
+                ranked[query] += [(1.0 / (RRF_K + rank + 1), version, i, s) for rank, (i, s) in enumerate(hits)]
+            if not lexical:
+                dense.append(query)
+        if dense:
+            k = max(top_k, HYBRID_CANDIDATES) if RETRIEVAL_MODE == "hybrid" else top_k
+            for (_, version), shard_hits in zip(versions, _dense_search([v for _, v in versions], dense, k)):
+                for query, hits in zip(dense, shard_hits):
+                    if RETRIEVAL_MODE == "hybrid":
+                        fused = _fuse([hits, version.lexical.search(_tokenize(query), k)], top_k)
+                        ranked[query] += [(s, version, i, s) for i, s in fused]
+                    else:
+                        ranked[query] += [(_similarity(d, version.index_config), version, i, d) for i, d in hits]
+        found = {}
+        for query in pending:
+            hits = []
+            for _, version, chunk_id, score in heapq.nlargest(top_k, ranked[query], key=lambda hit: hit[0]):
+                chunk = version.store.get(chunk_id)
+                if chunk is not None:
+                    hits.append((chunk[0], chunk[1], score))
+            found[query] = tuple(hits)
+            _result_cache.put((cache_key, query, top_k), found[query])
+        results = [found[q] if hits is None else hits for q, hits in zip(queries, results)]
+    return [list(hits) for hits in results]
+
+
+def retrieve_relevant_docs(query, top_k=5, shards=None):
+    """Retrieve top_k relevant documentation chunks for the query as (text, url) pairs."""
+    return [(text, url) for text, url, _ in retrieve_relevant_docs_batch([query], top_k, shards)[0]]
+
+
+def _chunk_vectors(index, chunk_ids):
+    """Stored vectors for chunk ids, or None if the index can't reconstruct them."""
+    try:
+        return np.vstack([index.reconstruct(chunk_id) for chunk_id in chunk_ids])
+    except RuntimeError:
+        return None
+
+
+def retrieve_context(query, token_budget=1500, candidates=20, diversity=0.3, shards=None):
+    """Retrieve prompt context for the query that fits in `token_budget` tokens.
+
+    Takes the `candidates` nearest chunks over the routed shards, re-ranks them
+    with MMR (`diversity` 0 is pure relevance) and merges overlapping windows
+    of the same page; see context_packer. Returns (text, url) passages, most
+    relevant first.
+    """
+    versions = [version for _, version in _load_versions(shards)]
+    model = _get_model()
+    query_vec = _encode_queries([query], model)
+    hits = []
+    for version, shard_hits in zip(versions, _dense_search(versions, [query], candidates)):
+        hits += [(_similarity(d, version.index_config), version, chunk_id) for chunk_id, d in shard_hits[0]]
+    chunks, vectors = [], []
+    for _, version, chunk_id in heapq.nlargest(candidates, hits, key=lambda hit: hit[0]):
+        chunk = version.store.get(chunk_id)
+        if chunk is not None:
+            chunks.append((chunk_id, chunk[1], chunk[0]))
+            vectors.append(_chunk_vectors(version.index, [chunk_id]))
+    if not chunks:
+        return []
+    if any(vector is None for vector in vectors):
+        vectors = model.encode([c[2] for c in chunks])
+    else:
+        vectors = np.vstack(vectors)
+    return context_packer.pack(query_vec[0], chunks, vectors, token_budget, diversity)
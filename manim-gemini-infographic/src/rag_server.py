@@ -0,0 +1,191 @@
+"""
+Long-lived retrieval daemon so worker processes share one loaded model and index.
+
+Serves rag_retriever over HTTP on localhost. Requests that arrive within
+--batch-window-ms of each other are answered with a single
+`retrieve_relevant_docs_batch` call, i.e. one encode and one index search.
+Workers talk to it through rag_client, which has the same signatures as
+rag_retriever.
+
+    POST /retrieve   {"queries": [...], "top_k": 5, "shards": [...]} -> {"results": [[[text, url, score], ...], ...]}
+    GET  /health     batching and cache counters
+
+Usage (from the directory holding manim_rag_db):
+    python src/rag_server.py --port 8765 --batch-window-ms 5 --max-batch 64
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rag_retriever
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class _Request:
+    def __init__(self, queries, top_k, shards):
+        self.queries = queries
+        self.top_k = top_k
+        self.shards = shards
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class QueryBatcher:
+    """Collects concurrent requests for up to `window` seconds and answers them with one batched call.
+
+    Requests in a batch may ask for different top_k; the batch is searched with
+    the largest and each request gets its own prefix. Requests routed to
+    different shards are searched in one call per shard selection.
+    """
+
+    def __init__(self, window=0.005, max_batch=64):
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, queries, top_k, shards=None):
+        request = _Request(queries, top_k, tuple(shards) if shards else None)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].queries)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.queries)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                groups = {}
+                for request in batch:
+                    groups.setdefault(request.shards, []).append(request)
+                for shards, group in groups.items():
+                    self._answer(group, shards)
+            except Exception as e:
+                # Never let this thread die: every waiting submit() must get an answer
+                print(f"[ERROR] Query batch failed: {e}")
+                self._fail(batch, e)
+
+    @staticmethod
+    def _fail(batch, error):
+        for request in batch:
+            if not request.done.is_set():
+                request.error = error
+                request.done.set()
+
+    def _answer(self, batch, shards):
+        try:
+            queries = [q for request in batch for q in request.queries]
+            results = rag_retriever.retrieve_relevant_docs_batch(queries, max(r.top_k for r in batch), shards)
+            answers = []
+            start = 0
+            for request in batch:
+                answers.append([hits[:request.top_k] for hits in results[start:start + len(request.queries)]])
+                start += len(request.queries)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self.batches += 1
+        self.queries += len(queries)
+        for request, results in zip(batch, answers):
+            request.results = results
+            request.done.set()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": self.queries / self.batches if self.batches else 0.0,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients reuse their connection
+    batcher = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {"batching": self.batcher.stats(), "cache": rag_retriever.cache_stats()})
+
+    def do_POST(self):
+        if self.path != "/retrieve":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            queries = [str(q) for q in request["queries"]]
+            top_k = int(request.get("top_k", 5))
+            shards = [str(name) for name in request.get("shards") or []]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+        try:
+            results = self.batcher.submit(queries, top_k, shards)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"results": results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, window_ms=5.0, max_batch=64):
+    """Load everything up front, then serve until interrupted."""
+    timings = rag_retriever.warmup()
+    print("[INFO] Retriever loaded: " + ", ".join(f"{phase} {secs:.2f}s" for phase, secs in timings.items()))
+    _Handler.batcher = QueryBatcher(window_ms / 1000.0, max_batch)
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    print(f"[INFO] Serving retrieval on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve rag_retriever to local worker processes")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0, help="How long to wait for more requests to batch")
+    parser.add_argument("--max-batch", type=int, default=64, help="Queries per batched encode/search")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.batch_window_ms, args.max_batch)
@@ -0,0 +1,381 @@
+"""
+Local static checks that decide whether the LLM review passes are worth a call.
+
+The single-frame generators used to send every reply through two more Gemini
+calls: an overlap review and a syntax review. Now each review only runs when
+the matching check here flags something:
+
+    syntax  Manim: compile() plus an AST check for the Scene class, imports
+            outside the standard library and SCENE_PACKAGES, and names from
+            older Manim or manimlib. D3: the inline scripts pass `node --check`
+            (or a bracket/string scan when node is not installed), and d3 is loaded.
+    layout  Manim: text mobjects that are never positioned (so they all sit at
+            ORIGIN), literal coordinates outside the frame, crowding. D3: text at
+            the same literal x/y, literal coordinates outside the SVG canvas.
+
+The checks are heuristics: they only catch the obvious cases, and the render
+step still catches the rest. GEMINI_REVIEW=always restores the unconditional
+reviews and GEMINI_REVIEW=never drops them. Every decision is counted in
+REVIEW_STATS_FILE, and `review_stats()` returns the counts.
+"""
+
+import ast
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from html.parser import HTMLParser
+
+REVIEW_MODES = ("auto", "always", "never")
+REVIEW_MODE = os.getenv("GEMINI_REVIEW", "auto")
+REVIEW_STATS_FILE = os.getenv("GEMINI_REVIEW_STATS", "./review_stats.json")  # "" to keep counts in memory only
+
+FRAME_X = 7.2          # Manim's default frame is 14.22 x 8 units, centred on ORIGIN
+FRAME_Y = 4.0
+MAX_TEXT_MOBJECTS = 24  # more labels than this will not fit one readable frame
+MAX_TEXT_CHARS = 70     # a default-size Text line longer than this runs off the frame unless scaled
+TEXT_CLASSES = {"Text", "Tex", "MathTex", "MarkupText", "Paragraph", "Title", "BulletedList"}
+POSITIONING = {
+    "move_to", "next_to", "to_edge", "to_corner", "shift", "align_to", "arrange", "arrange_in_grid",
+    "set_x", "set_y", "set_coord", "center", "match_x", "match_y",
+}
+ARRANGING = {"arrange", "arrange_in_grid"}
+DIRECTIONS = {"UP": (0, 1), "DOWN": (0, -1), "LEFT": (-1, 0), "RIGHT": (1, 0)}
+# Third-party packages a generated scene may import; whether they are installed here is the render step's business
+SCENE_PACKAGES = {"manim", "numpy", "scipy", "PIL"}
+# Names from older Manim CE releases or from manimlib, with their Manim CE replacement
+LEGACY_NAMES = {
+    "ShowCreation": "Create",
+    "TextMobject": "Text",
+    "TexMobject": "MathTex",
+    "TexText": "Tex",
+    "FadeInFrom": "FadeIn(mobject, shift=...)",
+    "FadeOutAndShift": "FadeOut(mobject, shift=...)",
+    "ShowCreationThenDestruction": "ShowPassingFlash",
+}
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def _positioned_names(tree):
+    """Names that get positioned: receivers of positioning calls, and (nested) members of arranged groups."""
+    groups = {}
+    placed = set()
+    arranged = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call):
+            members = [arg.id for arg in node.value.args if isinstance(arg, ast.Name)]
+            for target in node.targets:
+                if isinstance(target, ast.Name) and members:
+                    groups[target.id] = members
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in POSITIONING:
+            receiver = node.func.value
+            if isinstance(receiver, ast.Name):
+                placed.add(receiver.id)
+                if node.func.attr in ARRANGING:
+                    arranged.append(receiver.id)
+            elif isinstance(receiver, ast.Call) and node.func.attr in ARRANGING:
+                arranged.extend(arg.id for arg in receiver.args if isinstance(arg, ast.Name))
+    while arranged:
+        name = arranged.pop()
+        placed.add(name)
+        arranged.extend(member for member in groups.get(name, ()) if member not in placed)
+    return placed
+
+
+def _literal_point(node):
+    """(x, y) of a literal point such as [3, 2, 0], np.array([...]) or 3 * RIGHT + UP, else None."""
+    if isinstance(node, ast.Call) and node.args and getattr(node.func, "attr", getattr(node.func, "id", "")) == "array":
+        node = node.args[0]
+    if isinstance(node, (ast.List, ast.Tuple)) and len(node.elts) >= 2:
+        try:
+            return float(ast.literal_eval(node.elts[0])), float(ast.literal_eval(node.elts[1]))
+        except (ValueError, TypeError):
+            return None
+    if isinstance(node, ast.Name) and node.id in DIRECTIONS:
+        return DIRECTIONS[node.id]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mult, ast.Add, ast.Sub)):
+        left, right = node.left, node.right
+        if isinstance(node.op, ast.Mult):
+            if isinstance(left, ast.Name):
+                left, right = right, left
+            try:
+                scale = float(ast.literal_eval(left))
+            except (ValueError, TypeError):
+                return None
+            point = _literal_point(right)
+            return (point[0] * scale, point[1] * scale) if point else None
+        a, b = _literal_point(left), _literal_point(right)
+        if a and b:
+            sign = -1 if isinstance(node.op, ast.Sub) else 1
+            return a[0] + sign * b[0], a[1] + sign * b[1]
+    return None
+
+
+def manim_syntax_issues(code):
+    """Problems a Manim file has before it is ever rendered: syntax, missing Scene, foreign imports, legacy names.
+
+    The result depends only on `code`, not on what is installed in this environment.
+    """
+    try:
+        tree = ast.parse(code)
+        compile(tree, "<generated>", "exec")
+    except (SyntaxError, ValueError) as e:
+        return [f"SyntaxError: {e}"]
+    issues = []
+    scene = next((n for n in tree.body if isinstance(n, ast.ClassDef) and n.name == "Scene"), None)
+    if scene is None:
+        issues.append("no top-level class named 'Scene'")
+    elif not any(isinstance(n, ast.FunctionDef) and n.name == "construct" for n in scene.body):
+        issues.append("class Scene has no construct() method")
+    for node in ast.walk(tree):
+        modules = []
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        for module in modules:
+            root = module.split(".")[0]
+            if root == "manimlib":
+                issues.append(f"imports {module}, which is 3Blue1Brown's manimlib, not Manim Community Edition")
+            elif root not in SCENE_PACKAGES and root not in sys.stdlib_module_names:
+                issues.append(f"imports {module}, which is neither the standard library nor one of {', '.join(sorted(SCENE_PACKAGES))}")
+    defined = {n.name for n in ast.walk(tree) if isinstance(n, (ast.ClassDef, ast.FunctionDef))}
+    legacy = sorted({n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and n.id in LEGACY_NAMES} - defined)
+    issues.extend(f"uses {name}, which Manim Community Edition replaced with {LEGACY_NAMES[name]}" for name in legacy)
+    return issues
+
+
+def manim_layout_issues(code):
+    """Likely overlaps and overflow in a single-frame Manim scene; [] when nothing stands out."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []  # the syntax check reports this
+    texts = {}
+    text_count = 0
+    issues = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and getattr(node.func, "id", None) in TEXT_CLASSES:
+            text_count += 1
+            strings = [a.value for a in node.args if isinstance(a, ast.Constant) and isinstance(a.value, str)]
+            longest = max((len(line) for s in strings for line in s.split("\n")), default=0)
+            if node.func.id == "Text" and longest > MAX_TEXT_CHARS and not any(k.arg in ("font_size", "width") for k in node.keywords):
+                issues.append(f"a {longest}-character Text line at the default font size overflows the frame")
+        # Title places itself at the top edge
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) and getattr(node.value.func, "id", None) in TEXT_CLASSES - {"Title"}:
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    texts[target.id] = node.value.func.id
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "move_to" and node.args:
+            point = _literal_point(node.args[0])
+            if point and (abs(point[0]) > FRAME_X or abs(point[1]) > FRAME_Y):
+                issues.append(f"move_to({ast.unparse(node.args[0])}) is outside the frame")
+    placed = _positioned_names(tree)
+    unplaced = sorted(name for name in texts if name not in placed)
+    if len(unplaced) > 1:
+        issues.append(f"text mobjects {', '.join(unplaced)} are never positioned, so they overlap at ORIGIN")
+    if text_count > MAX_TEXT_MOBJECTS:
+        issues.append(f"{text_count} text mobjects are too many for one readable frame")
+    return issues
+
+
+class _ScriptCollector(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.scripts = []
+        self.sources = []
+        self.svg = {}
+        self._in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script":
+            self._in_script = "src" not in attrs and attrs.get("type", "text/javascript") in ("text/javascript", "module")
+            if "src" in attrs:
+                self.sources.append(attrs["src"])
+            elif self._in_script:
+                self.scripts.append("")
+        elif tag == "svg" and not self.svg:
+            self.svg = attrs
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self._in_script = False
+
+    def handle_data(self, data):
+        if self._in_script:
+            self.scripts[-1] += data
+
+
+def _js_balance_error(script):
+    """Scan for unbalanced brackets and unterminated strings or comments; a fallback for `node --check`."""
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack = []
+    i = 0
+    while i < len(script):
+        c = script[i]
+        if c in "\"'`":
+            end = i + 1
+            while end < len(script) and script[end] != c:
+                if script[end] == "\n" and c != "`":
+                    return f"unterminated string at offset {i}"
+                end += 2 if script[end] == "\\" else 1
+            if end >= len(script):
+                return f"unterminated string at offset {i}"
+            i = end
+        elif script.startswith("//", i):
+            i = script.find("\n", i) if "\n" in script[i:] else len(script)
+        elif script.startswith("/*", i):
+            end = script.find("*/", i + 2)
+            if end < 0:
+                return f"unterminated comment at offset {i}"
+            i = end + 1
+        elif c in "([{":
+            stack.append(c)
+        elif c in pairs:
+            if not stack or stack.pop() != pairs[c]:
+                return f"unmatched '{c}' at offset {i}"
+        i += 1
+    return f"unclosed '{stack[-1]}'" if stack else None
+
+
+def _js_syntax_error(script):
+    node = shutil.which("node")
+    if node is None:
+        return _js_balance_error(script)
+    module = re.search(r"^\s*(import|export)\s", script, re.M) is not None
+    with tempfile.NamedTemporaryFile("w", suffix=".mjs" if module else ".js", delete=False, encoding="utf-8") as f:
+        f.write(script)
+    try:
+        result = subprocess.run([node, "--check", f.name], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return _js_balance_error(script)
+    finally:
+        os.remove(f.name)
+    if result.returncode == 0:
+        return None
+    lines = [line for line in result.stderr.splitlines() if "Error" in line]
+    return lines[0].strip() if lines else "node --check failed"
+
+
+def _parse_html(html):
+    collector = _ScriptCollector()
+    collector.feed(html)
+    collector.close()
+    return collector
+
+
+def d3_syntax_issues(html):
+    """Problems in a standalone D3 page: script syntax, d3 used but never loaded, nothing drawn."""
+    page = _parse_html(html)
+    issues = []
+    for n, script in enumerate(page.scripts, 1):
+        if script.strip():
+            error = _js_syntax_error(script)
+            if error:
+                issues.append(f"script {n}: {error}")
+    script_text = "\n".join(page.scripts)
+    imports_d3 = re.search(r"""from\s+["'][^"']*d3""", script_text) is not None
+    if "d3." in script_text and not imports_d3 and not any("d3" in src for src in page.sources):
+        issues.append("uses d3 but never loads it with a <script src=...>")
+    if not page.svg and not re.search(r"""append\(\s*["']svg["']""", script_text):
+        issues.append("creates no <svg>")
+    return issues
+
+
+_ATTR = re.compile(r"""\.attr\(\s*["'](x|y|cx|cy|width|height)["']\s*,\s*(-?\d+(?:\.\d+)?)\s*\)""")
+_APPEND = re.compile(r"""\.append\(\s*["'](\w+)["']\s*\)""")
+
+
+def _canvas_size(page, script_text):
+    width = page.svg.get("width")
+    height = page.svg.get("height")
+    view_box = page.svg.get("viewbox", "").split()
+    if len(view_box) == 4:
+        width, height = width or view_box[2], height or view_box[3]
+    for name in ("width", "height"):
+        if (width if name == "width" else height) is None:
+            match = re.search(rf"(?:\b(?:const|let|var)\s+|,\s*){name}\s*=\s*(\d+(?:\.\d+)?)\s*[;,\n]", script_text)
+            match = match or re.search(rf"""append\(\s*["']svg["']\s*\)[^;]*?\.attr\(\s*["']{name}["']\s*,\s*(\d+(?:\.\d+)?)""", script_text, re.S)
+            if match:
+                width, height = (match.group(1), height) if name == "width" else (width, match.group(1))
+    try:
+        return float(str(width).rstrip("px")), float(str(height).rstrip("px"))
+    except (TypeError, ValueError):
+        return None
+
+
+def d3_layout_issues(html):
+    """Text drawn at the same literal position and literal coordinates outside the SVG canvas."""
+    page = _parse_html(html)
+    script_text = "\n".join(page.scripts)
+    canvas = _canvas_size(page, script_text)
+    issues = []
+    seen = set()
+    appends = list(_APPEND.finditer(script_text))
+    for n, match in enumerate(appends):
+        end = appends[n + 1].start() if n + 1 < len(appends) else len(script_text)
+        statement_end = script_text.find(";", match.end(), end)
+        segment = script_text[match.end():statement_end if statement_end >= 0 else end]
+        attrs = {name: float(value) for name, value in _ATTR.findall(segment)}
+        x, y = attrs.get("x", attrs.get("cx")), attrs.get("y", attrs.get("cy"))
+        if match.group(1) == "text" and x is not None and y is not None:
+            if (x, y) in seen:
+                issues.append(f"two text elements at ({x:g}, {y:g})")
+            seen.add((x, y))
+        if canvas and match.group(1) != "svg":
+            if (x is not None and not 0 <= x <= canvas[0]) or (y is not None and not 0 <= y <= canvas[1]):
+                position = ", ".join("?" if v is None else f"{v:g}" for v in (x, y))
+                issues.append(f"<{match.group(1)}> at ({position}) is outside the {canvas[0]:g}x{canvas[1]:g} canvas")
+    return issues
+
+
+def _record(review, ran):
+    with _lock:
+        counts = _stats.setdefault(review, {"run": 0, "skipped": 0})
+        counts["run" if ran else "skipped"] += 1
+        if not REVIEW_STATS_FILE:
+            return
+        try:
+            with open(REVIEW_STATS_FILE, "r", encoding="utf-8") as f:
+                totals = json.load(f)
+        except (OSError, ValueError):
+            totals = {}
+        total = totals.setdefault(review, {"run": 0, "skipped": 0})
+        total["run" if ran else "skipped"] += 1
+        tmp_path = REVIEW_STATS_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(totals, f, indent=2)
+        os.replace(tmp_path, REVIEW_STATS_FILE)
+
+
+def review_needed(review, issues):
+    """Whether to send the `review` pass ("overlap" or "syntax") given the local `issues`; counts the decision."""
+    if REVIEW_MODE not in REVIEW_MODES:
+        raise ValueError(f"Unknown GEMINI_REVIEW mode {REVIEW_MODE!r}, expected one of {', '.join(REVIEW_MODES)}")
+    ran = REVIEW_MODE == "always" or (REVIEW_MODE == "auto" and bool(issues))
+    if issues:
+        print(f"[INFO] Local {review} check flagged: {'; '.join(issues)}")
+    if not ran:
+        print(f"[INFO] Skipping the {review} review call" + ("" if issues else ": local check passed"))
+    _record(review, ran)
+    return ran
+
+
+def issues_note(issues):
+    """The flagged issues as a prompt paragraph for the review call; "" when there are none."""
+    if not issues:
+        return ""
+    return "Automated checks flagged:\n" + "".join(f"- {issue}\n" for issue in issues) + "\n"
+
+
+def review_stats():
+    """This process's {review: {"run": n, "skipped": n}} counts; REVIEW_STATS_FILE holds the running totals."""
+    with _lock:
+        return {review: dict(counts) for review, counts in _stats.items()}
@@ -1,3 +1,10 @@
+import os
+import time
+
+# Successful generations are kept here and indexed as the "generations" RAG shard:
+#     python rag_setup.py --shard generations --source files:generations
+GENERATIONS_DIR = os.getenv("RAG_GENERATIONS_DIR", "./generations")
+
 def save_gif(output_path):
     """Saves the rendered GIF to the specified output path."""
     # Implementation for saving the GIF will go here
@@ -10,4 +17,13 @@ def load_config(config_path):
 
 def log_message(message):
     """Logs a message to the console or a log file."""
-    print(message)  # Simple console logging for now
\ No newline at end of file
+    print(message)  # Simple console logging for now
+
+def save_generation(code, prompt, extension):
+    """Keeps a copy of code that rendered (or was accepted) for the generations shard; returns its path."""
+    os.makedirs(GENERATIONS_DIR, exist_ok=True)
+    path = os.path.join(GENERATIONS_DIR, time.strftime("%Y%m%d-%H%M%S") + extension)
+    header = f"<!-- Prompt: {prompt} -->" if extension == ".html" else f"# Prompt: {prompt}"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header.replace("\n", " ") + "\n" + code)
+    return path
@@ -0,0 +1,257 @@
+"""
+Offline page sources for rag_setup: a local Sphinx HTML build, a tarball of
+one, the docstrings and signatures of an installed package, or a directory of
+loose files (example scenes, a docs checkout, saved generations).
+
+Every source returns (keys, pages): the sorted page keys, used to spot deleted
+pages, and an iterator of (key, text) in that order, with text None for a page
+that could not be read. HTML parsing and AST extraction run in a process pool,
+so a build from local files is limited by CPU and disk, not the network.
+"""
+
+import ast
+import importlib.util
+import os
+import tarfile
+import textwrap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from chunking import html_to_text
+
+SOURCE_WORKERS = int(os.getenv("RAG_SOURCE_WORKERS", str(os.cpu_count() or 1)))
+MAIN_SELECTORS = ("article#furo-main-content", "div.body", "div.document", "main")  # Sphinx themes, then generic
+# Sphinx output that is navigation or generated indexes, not documentation
+SKIP_PAGES = {"genindex.html", "search.html", "py-modindex.html"}
+TEXT_EXTENSIONS = {".md", ".txt", ".rst"}  # already in (or close enough to) the chunker's heading format
+CODE_EXTENSIONS = {".py", ".js", ".mjs", ".ts", ".html"}
+
+
+def extract_main_text(content):
+    """Return the cleaned main article of a docs page, or None if it has none."""
+    soup = BeautifulSoup(content, "html.parser")
+    for selector in MAIN_SELECTORS:
+        doc = soup.select_one(selector)
+        if doc:
+            return html_to_text(doc)
+    return None
+
+
+def _read_and_extract(path):
+    with open(path, "rb") as f:
+        return extract_main_text(f.read())
+
+
+def _process_pages(fn, items, workers=SOURCE_WORKERS):
+    """Apply `fn` to the args of (key, arg) items in a process pool, yielding (key, result) in order.
+
+    Like rag_setup.crawl_pages, at most ``2 * workers`` items are in flight.
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+
+        def result(key, future):
+            try:
+                return key, future.result()
+            except Exception as e:
+                print(f"[ERROR] Failed to process {key}: {e}")
+                return key, None
+
+        for key, arg in items:
+            pending.append((key, executor.submit(fn, arg)))
+            if len(pending) >= 2 * workers:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+
+
+def _is_doc_page(relpath):
+    parts = relpath.split("/")
+    return relpath.endswith(".html") and parts[-1] not in SKIP_PAGES and not any(p.startswith("_") for p in parts)
+
+
+def sphinx_dir_pages(root, base_url):
+    """Pages of a Sphinx HTML build directory, keyed as if served from `base_url`."""
+    relpaths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in filenames:
+            relpath = os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, "/")
+            if _is_doc_page(relpath):
+                relpaths.append(relpath)
+    relpaths.sort()
+    keys = [base_url + relpath for relpath in relpaths]
+    items = ((key, os.path.join(root, relpath)) for key, relpath in zip(keys, relpaths))
+    return keys, _process_pages(_read_and_extract, items)
+
+
+def tarball_pages(path, base_url):
+    """Pages of a (possibly compressed) tarball of a Sphinx HTML build, keyed as if served from `base_url`.
+
+    A single top-level directory in the archive (e.g. ``html/``) is not part of the key.
+    """
+    tar = tarfile.open(path)
+    members = sorted((m for m in tar.getmembers() if m.isfile()), key=lambda m: m.name)
+    names = [m.name.removeprefix("./") for m in members]
+    tops = {name.split("/", 1)[0] for name in names}
+    if len(tops) == 1 and all("/" in name for name in names):
+        names = [name.split("/", 1)[1] for name in names]
+    selected = [(name, member) for name, member in zip(names, members) if _is_doc_page(name)]
+    keys = [base_url + name for name, _ in selected]
+
+    def items():
+        try:
+            for key, (_, member) in zip(keys, selected):
+                yield key, tar.extractfile(member).read()
+        finally:
+            tar.close()
+
+    return keys, _process_pages(extract_main_text, items())
+
+
+def _docstring_text(doc):
+    """Docstring as paragraphs, with indented and doctest blocks fenced as code."""
+    out = []
+    code = []
+
+    def flush_code():
+        if code:
+            out.append("```\n" + textwrap.dedent("\n".join(code)).strip("\n") + "\n```")
+            code.clear()
+
+    for line in doc.split("\n"):
+        if line.startswith((" ", "\t", ">>>")) or (code and not line.strip()):
+            code.append(line)
+            continue
+        flush_code()
+        out.append(line)
+    flush_code()
+    return "\n".join(out)
+
+
+def _module_text(args):
+    """Render a module's public API (signatures and docstrings) in the chunker's heading format."""
+    path, module = args
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    blocks = [f"# {module}"]
+
+    def add_doc(node):
+        doc = ast.get_docstring(node)
+        if doc:
+            blocks.append(_docstring_text(doc))
+
+    def signature(node):
+        returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+        return f"{node.name}({ast.unparse(node.args)}){returns}"
+
+    add_doc(tree)
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and not node.name.startswith("_"):
+            bases = ", ".join(ast.unparse(base) for base in node.bases)
+            blocks.append(f"## class {node.name}({bases})")
+            add_doc(node)
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and (
+                    not item.name.startswith("_") or item.name == "__init__"
+                ):
+                    blocks.append(f"### {node.name}.{signature(item)}")
+                    add_doc(item)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("_"):
+            blocks.append(f"## def {signature(node)}")
+            add_doc(node)
+    return "\n\n".join(blocks)
+
+
+def package_pages(package):
+    """One page per module of an installed package (e.g. manim, manimlib), read from source via AST.
+
+    The package is located but never imported. Keys look like ``python://manim.mobject.geometry.arc``.
+    """
+    spec = importlib.util.find_spec(package)
+    if spec is None or not spec.submodule_search_locations:
+        raise ValueError(f"Package {package!r} is not installed")
+    root = list(spec.submodule_search_locations)[0]
+    modules = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "__pycache__" and not d.startswith((".", "test")))
+        for name in filenames:
+            if name.endswith(".py"):
+                relpath = os.path.relpath(os.path.join(dirpath, name), root)[:-3]
+                parts = [package] + relpath.split(os.sep)
+                if parts[-1] == "__init__":
+                    parts.pop()
+                modules.append((".".join(parts), os.path.join(dirpath, name)))
+    modules.sort()
+    keys = [f"python://{module}" for module, _ in modules]
+    items = ((key, (path, module)) for key, (module, path) in zip(keys, modules))
+    return keys, _process_pages(_module_text, items)
+
+
+def _code_blocks(source):
+    """Blank-line separated blocks of `source`, each fenced."""
+    blocks = [block.strip("\n") for block in source.split("\n\n")]
+    return [f"```\n{block}\n```" for block in blocks if block.strip()]
+
+
+def _python_blocks(source):
+    """One fenced block per top-level statement run, with a heading for each class and function."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return _code_blocks(source)
+    lines = source.split("\n")
+    starts = [min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1 for node in tree.body]
+    groups = []  # [heading or None, segments]; runs of imports and assignments share one group
+    for i, node in enumerate(tree.body):
+        segment = "\n".join(lines[starts[i]:starts[i + 1] if i + 1 < len(starts) else len(lines)]).strip("\n")
+        if isinstance(node, ast.ClassDef):
+            groups.append([f"## class {node.name}", [segment]])
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            groups.append([f"## def {node.name}", [segment]])
+        elif groups and groups[-1][0] is None:
+            groups[-1][1].append(segment)
+        else:
+            groups.append([None, [segment]])
+    blocks = []
+    for heading, segments in groups:
+        if heading:
+            blocks.append(heading)
+        blocks.append("```\n" + "\n".join(segments) + "\n```")
+    return blocks
+
+
+def _file_text(args):
+    """Render a loose file: HTML by its main content, docs as-is, source code as fenced blocks under its path."""
+    path, relpath = args
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read()
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".html":
+        text = extract_main_text(content)
+        # A standalone page (e.g. a saved D3 generation) has no docs layout: index its markup and script
+        return text if text and "<script" not in content else "\n\n".join([f"# {relpath}"] + _code_blocks(content))
+    if extension in TEXT_EXTENSIONS:
+        return content
+    return "\n\n".join([f"# {relpath}"] + (_python_blocks(content) if extension == ".py" else _code_blocks(content)))
+
+
+def file_pages(root):
+    """Every docs, text and source file under `root`, e.g. manimlib's example scenes or saved generations.
+
+    Keys look like ``file://<name of root>/<relative path>``, so the same tree
+    checked out elsewhere maps to the same pages.
+    """
+    name = os.path.basename(os.path.normpath(root))
+    relpaths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith((".", "_")) and d != "node_modules")
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS | CODE_EXTENSIONS:
+                relpaths.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"))
+    relpaths.sort()
+    keys = [f"file://{name}/{relpath}" for relpath in relpaths]
+    items = ((key, (os.path.join(root, relpath), relpath)) for key, relpath in zip(keys, relpaths))
+    return keys, _process_pages(_file_text, items)
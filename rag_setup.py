@@ -1,107 +1,685 @@
 import os
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
-import pickle
+from embedding_cache import EmbeddingCache
+from chunk_store import ChunkStoreWriter, iter_chunks, store_exists, store_paths
+from lexical_index import lexical_exists, write_lexical_index
+from chunking import MinHashDeduper, chunk_text
+from offline_sources import SOURCE_WORKERS, extract_main_text, file_pages, package_pages, sphinx_dir_pages, tarball_pages
 
 # Config
-BASE_URL = "https://docs.manim.community/en/stable/"
+# BASE_URL can be pointed at a local copy of the docs (e.g. served by bench_crawler.py)
+BASE_URL = os.getenv("MANIM_DOCS_BASE_URL", "https://docs.manim.community/en/stable/")
 REFERENCE_PAGE = BASE_URL + "reference.html"
-CHUNK_SIZE = 500
-CHUNK_OVERLAP = 100
+# Token limit per chunk; all-MiniLM-L6-v2 truncates at 256 word pieces and count_tokens undercounts a little
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "200"))
+DEDUPE_THRESHOLD = float(os.getenv("RAG_DEDUPE_THRESHOLD", "0.9"))  # MinHash Jaccard estimate, 0 disables
 EMBED_MODEL = "all-MiniLM-L6-v2"
 OUTPUT_DIR = "./manim_rag_db"
+# Each shard is built on its own, from its own sources, into shards/<name>; rag_retriever
+# searches the shards a caller routes to and merges their hits by score
+SHARDS_DIR = os.path.join(OUTPUT_DIR, "shards")
+SHARDS = ("manim_ce", "manimlib", "d3", "generations")
+DEFAULT_SHARD = "manim_ce"
+# Every build writes a complete new version under <shard>/versions/ and then repoints
+# <shard>/CURRENT at it, so readers (rag_retriever) only ever see finished builds
+KEEP_VERSIONS = int(os.getenv("RAG_KEEP_VERSIONS", "3"))  # versions kept for processes still using them
+INDEX_NAME = "manim_faiss.index"
+MANIFEST_NAME = "manifest.json"
+INDEX_CONFIG_NAME = "manim_index_config.json"  # read by rag_retriever
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))  # chunks embedded and indexed per step
+EMBED_WORKERS = int(os.getenv("RAG_EMBED_WORKERS", "1"))  # >1 shards encoding over processes, 0 = one per core
+ENCODE_BATCH_SIZE = int(os.getenv("RAG_ENCODE_BATCH_SIZE", "32"))  # model forward-pass batch size
+# Shared by every build (and every index type / chunking experiment); set to "" to disable
+EMBED_CACHE_DIR = os.getenv("RAG_EMBED_CACHE_DIR", os.path.join(OUTPUT_DIR, "embedding_cache"))
+
+# Index config
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+INDEX_PARAMS = {
+    "nlist": 256,             # IVF: number of clusters
+    "nprobe": 16,             # IVF: clusters scanned per query
+    "pq_m": 16,               # IVF-PQ: sub-quantizers, must divide the embedding dim
+    "pq_nbits": 8,            # IVF-PQ: bits per sub-quantizer code
+    "hnsw_m": 32,             # HNSW: neighbours per node
+    "ef_construction": 200,   # HNSW: build-time search depth
+    "ef_search": 64,          # HNSW: query-time search depth
+    "metric": "l2",           # l2, or cosine (L2-normalized vectors, inner-product search)
+    "storage": "float32",     # float32, float16 or int8 (FAISS scalar quantizer); ignored by ivf_pq
+}
+INDEX_PARAMS.update(json.loads(os.getenv("RAG_INDEX_PARAMS", "{}")))
+SEARCH_PARAMS = ("nprobe", "ef_search")  # query-time only, changing them never needs a rebuild
+SQ_TRAIN_SIZE = 10000  # vectors used to fit the int8 quantizer ranges
+_STORAGE_CODECS = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+# Crawler config
+CRAWL_WORKERS = int(os.getenv("RAG_CRAWL_WORKERS", "8"))
+HOST_RATE_LIMIT = float(os.getenv("RAG_HOST_RATE_LIMIT", "10"))  # requests/second per host, 0 disables
+REQUEST_TIMEOUT = (5, 30)  # (connect, read) seconds
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5  # sleeps 0.5s, 1s, 2s between retries
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+
+class HostRateLimiter:
+    """Spaces out requests so each host sees at most `rate` requests per second."""
+
+    def __init__(self, rate=HOST_RATE_LIMIT):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def make_session(pool_size=CRAWL_WORKERS):
+    """Keep-alive session with a connection pool sized for the crawler and retry/backoff on transient errors."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _get(url, session, limiter):
+    limiter.wait(url)
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response
+
 # Step 1: Scrape documentation links
-def fetch_doc_links():
-    page = requests.get(REFERENCE_PAGE)
+def fetch_doc_links(session=None, base_url=BASE_URL, limiter=None):
+    session = session or make_session()
+    limiter = limiter or HostRateLimiter()
+    page = _get(base_url + "reference.html", session, limiter)
     soup = BeautifulSoup(page.content, 'html.parser')
     links = [a['href'] for a in soup.select('a.reference.internal') if a['href'].endswith(".html")]
-    full_links = [BASE_URL + href for href in links]
-    return list(set(full_links))
+    full_links = [base_url + href for href in links]
+    # Sorted so the crawl (and therefore chunk order) is the same on every run
+    return sorted(set(full_links))
 
 # Step 2: Download and clean each page
-def fetch_and_clean(url):
+def fetch_and_clean(url, session=None, limiter=None):
+    session = session or make_session(1)
+    limiter = limiter or HostRateLimiter()
     try:
-        content = requests.get(url).text
-        soup = BeautifulSoup(content, 'html.parser')
-        doc = soup.select_one("article#furo-main-content")
-        if not doc:
-            doc = soup.select_one("div.body")
-        if not doc:
-            doc = soup.select_one("div.document")
-        if doc:
-            return doc.get_text(separator="\n", strip=True)
+        return extract_main_text(_get(url, session, limiter).text)
     except Exception as e:
         print(f"[ERROR] Failed to fetch {url}: {e}")
     return None
 
-# Step 3: Chunk text
-
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    if size <= overlap:
-        raise ValueError("CHUNK_SIZE must be greater than CHUNK_OVERLAP")
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), size - overlap):
-        chunk = " ".join(words[i:i+size])
-        chunks.append(chunk)
-    return chunks
-
-# Step 4: Build and save FAISS index
-def build_faiss_index(chunks, metadata, model_name=EMBED_MODEL):
-    # Filter out empty chunks and corresponding metadata
-    filtered = [(c, m) for c, m in zip(chunks, metadata) if c.strip()]
-    if not filtered:
-        print("[ERROR] No non-empty chunks to index.")
-        return
-    chunks, metadata = zip(*filtered)
-    model = SentenceTransformer(model_name)
-    print("[INFO] Generating embeddings...")
-    embeddings = model.encode(list(chunks), show_progress_bar=True)
-    if embeddings.shape[0] == 0:
-        print("[ERROR] No embeddings generated. Exiting.")
-        return
 
-    print("[INFO] Building FAISS index...")
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(embeddings))
+def crawl_pages(links, workers=CRAWL_WORKERS, session=None, limiter=None):
+    """Fetch and clean `links` on a thread pool, yielding (url, text) in input order.
+
+    At most ``2 * workers`` pages are in flight or waiting to be consumed, so a
+    slow consumer never makes the crawler buffer the whole site in memory.
+    """
+    session = session or make_session(workers)
+    limiter = limiter or HostRateLimiter()
+    window = 2 * max(1, workers)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for url in links:
+            pending.append((url, pool.submit(fetch_and_clean, url, session, limiter)))
+            if len(pending) >= window:
+                head_url, future = pending.popleft()
+                yield head_url, future.result()
+        while pending:
+            head_url, future = pending.popleft()
+            yield head_url, future.result()
+
+# Step 3: Chunk text (structure-aware, see chunking.py)
+
+# Step 4: Streaming, incremental index maintenance
+def page_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_index_config(index_type=INDEX_TYPE, overrides=None):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    params = dict(INDEX_PARAMS)
+    params.update(overrides or {})
+    if params["metric"] not in ("l2", "cosine"):
+        raise ValueError(f"Unknown metric {params['metric']!r}, expected l2 or cosine")
+    if params["storage"] not in _STORAGE_CODECS:
+        raise ValueError(f"Unknown storage {params['storage']!r}, expected one of {tuple(_STORAGE_CODECS)}")
+    return {"type": index_type, "params": params}
+
+
+def training_size(config):
+    """Vectors to collect before training the index (0 for index types that need no training)."""
+    params = config["params"]
+    if config["type"] == "ivf_flat":
+        return params["nlist"] * 39
+    if config["type"] == "ivf_pq":
+        return max(params["nlist"], 2 ** params["pq_nbits"]) * 39
+    if params["storage"] == "int8":
+        return SQ_TRAIN_SIZE
+    return 0
+
+
+def prepare_vectors(vectors, config):
+    """Return vectors in the form the index stores: L2-normalized copies for the cosine metric."""
+    if config["params"]["metric"] != "cosine":
+        return vectors
+    vectors = np.array(vectors, dtype="float32", copy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_index(dim, config, train_vectors=None):
+    """Create (and if needed, train) an index that supports add_with_ids.
+
+    `train_vectors` must already be prepared (see prepare_vectors). Cluster and
+    code counts are clamped to what they can support, so small corpora still
+    build. Returns the index and the config actually used.
+    """
+    config = {"type": config["type"], "params": dict(config["params"]), "dim": dim}
+    params = config["params"]
+    n_train = 0 if train_vectors is None else len(train_vectors)
+    metric = faiss.METRIC_INNER_PRODUCT if params["metric"] == "cosine" else faiss.METRIC_L2
+    codec = _STORAGE_CODECS[params["storage"]]
+    if config["type"] == "flat":
+        index = faiss.index_factory(dim, f"IDMap2,{codec}", metric)
+    elif config["type"] == "hnsw":
+        suffix = "" if codec == "Flat" else "," + codec
+        index = faiss.index_factory(dim, f"IDMap2,HNSW{params['hnsw_m']}{suffix}", metric)
+        faiss.downcast_index(index.index).hnsw.efConstruction = params["ef_construction"]
+    else:
+        # IVF indexes store external ids themselves, so no IDMap wrapper (and removal still works)
+        params["nlist"] = max(1, min(params["nlist"], n_train // 39))
+        if config["type"] == "ivf_flat":
+            index = faiss.index_factory(dim, f"IVF{params['nlist']},{codec}", metric)
+        else:
+            params["pq_m"] = max(m for m in range(1, params["pq_m"] + 1) if dim % m == 0)
+            params["pq_nbits"] = max(1, min(params["pq_nbits"], int(math.log2(max(n_train, 2)))))
+            index = faiss.index_factory(dim, f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}", metric)
+    if not index.is_trained:
+        index.train(train_vectors)
+    return index, config
+
+
+def apply_search_params(index, config):
+    params = config["params"]
+    if config["type"] in ("ivf_flat", "ivf_pq"):
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", params["nprobe"])
+    elif config["type"] == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", params["ef_search"])
+
+
+def _manifest_settings(index_config):
+    # Anything that changes how chunks or vectors are produced, or how the index is
+    # structured, invalidates the whole store (the embedding cache makes that cheap)
+    build_params = {k: v for k, v in index_config["params"].items() if k not in SEARCH_PARAMS}
+    return {
+        "embed_model": EMBED_MODEL,
+        "chunker": "structured",
+        "chunk_tokens": CHUNK_TOKENS,
+        "dedupe_threshold": DEDUPE_THRESHOLD,
+        "dedupe_scope": "page",
+        "index_type": index_config["type"],
+        "index_params": build_params,
+    }
+
+
+def shard_dir(shard):
+    return os.path.join(SHARDS_DIR, shard)
+
+
+def _version_names(shard):
+    """Version directory names of a shard (v000001, v000002, ...), oldest first."""
+    versions_dir = os.path.join(shard_dir(shard), "versions")
+    names = os.listdir(versions_dir) if os.path.isdir(versions_dir) else []
+    return sorted((name for name in names if re.fullmatch(r"v\d+", name)), key=lambda name: int(name[1:]))
+
+
+def current_version_dir(shard=DEFAULT_SHARD):
+    """Directory of the shard's live build, or None if it has not been built yet.
+
+    That is the version the shard's CURRENT names. The default shard also
+    picks up a build made before shards (OUTPUT_DIR/CURRENT) or before
+    versioning (files directly in OUTPUT_DIR), so the next build continues from it.
+    """
+    roots = [shard_dir(shard)] + ([OUTPUT_DIR] if shard == DEFAULT_SHARD else [])
+    for root in roots:
+        try:
+            with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+                return os.path.join(root, "versions", f.read().strip())
+        except FileNotFoundError:
+            pass
+    if shard == DEFAULT_SHARD and os.path.exists(os.path.join(OUTPUT_DIR, MANIFEST_NAME)):
+        return OUTPUT_DIR
+    return None
+
+
+def new_version_dir(shard):
+    names = _version_names(shard)
+    path = os.path.join(shard_dir(shard), "versions", f"v{int(names[-1][1:]) + 1 if names else 1:06d}")
+    os.makedirs(path)
+    return path
+
 
-    # Save index and metadata
-    faiss.write_index(index, os.path.join(OUTPUT_DIR, "manim_faiss.index"))
-    with open(os.path.join(OUTPUT_DIR, "manim_chunks.pkl"), "wb") as f:
-        pickle.dump(list(chunks), f)
-    with open(os.path.join(OUTPUT_DIR, "manim_metadata.pkl"), "wb") as f:
-        pickle.dump(list(metadata), f)
+def publish_version(shard, directory):
+    """Atomically point the shard's CURRENT at a finished version directory, then prune old versions."""
+    current_path = os.path.join(shard_dir(shard), "CURRENT")
+    with open(current_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(directory) + "\n")
+    os.replace(current_path + ".tmp", current_path)
+    prune_versions(shard, os.path.basename(directory))
 
-    print(f"[DONE] Saved {len(chunks)} chunks to {OUTPUT_DIR}")
+
+def prune_versions(shard, live, keep=KEEP_VERSIONS):
+    """Delete all but the newest `keep` versions of a shard, never the live one.
+
+    A process still reading a pruned version is unaffected: its mmaps and
+    loaded index outlive the unlinked files, and rag_retriever moves to the
+    live version on its next query.
+    """
+    stale = [name for name in _version_names(shard) if name != live]
+    for name in stale[:max(0, len(stale) - max(keep - 1, 0))]:
+        shutil.rmtree(os.path.join(shard_dir(shard), "versions", name), ignore_errors=True)
+
+
+def load_store(index_config, directory):
+    """Load the manifest and ID-mapped index of the build in `directory`.
+
+    Returns None when there is nothing reusable on disk (first run, settings
+    changed, or a legacy positional index), in which case the caller rebuilds.
+    Chunk text is never loaded; it stays in the chunk store (see chunk_store.py).
+    """
+    manifest_path, index_path = os.path.join(directory, MANIFEST_NAME), os.path.join(directory, INDEX_NAME)
+    if not all(os.path.exists(p) for p in (manifest_path, index_path)) or not store_exists(directory):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("settings") != _manifest_settings(index_config):
+        print("[INFO] Index settings changed since last build, rebuilding from scratch")
+        return None
+    index = faiss.read_index(index_path)
+    if not isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+        print("[INFO] Existing index is not ID-mapped, rebuilding from scratch")
+        return None
+    return manifest, index
+
+
+class ChunkEncoder:
+    """Encodes chunk lists in this process or sharded over a pool of CPU worker processes.
+
+    sentence-transformers reassembles the shards in input order, so the result
+    matches single-process `model.encode` row for row.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL, workers=EMBED_WORKERS, batch_size=ENCODE_BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self._model = None
+        self._pool = None
+
+    def _start_pool(self):
+        # Give each worker its share of the cores instead of letting every torch runtime grab all of them
+        threads = str(max(1, (os.cpu_count() or 1) // self.workers))
+        saved = {name: os.environ.get(name) for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")}
+        os.environ.update({name: threads for name in saved})
+        try:
+            self._pool = self._model.start_multi_process_pool(["cpu"] * self.workers)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def encode(self, texts):
+        texts = list(texts)
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        # Not worth the IPC round trip unless every worker gets at least one full batch
+        if self.workers <= 1 or len(texts) < self.workers * self.batch_size:
+            return self._model.encode(texts, batch_size=self.batch_size)
+        if self._pool is None:
+            self._start_pool()
+        return self._model.encode(
+            texts, pool=self._pool, batch_size=self.batch_size, chunk_size=math.ceil(len(texts) / self.workers)
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+class StreamingIndexBuilder:
+    """Embeds chunks in fixed-size batches and adds them to the index as they arrive.
+
+    At most one batch of chunk text and embeddings is held in memory; chunk
+    text goes straight to a ChunkStoreWriter, which streams the old store in
+    `source_dir` (None for a fresh build) into the new one in `directory`.
+    """
+
+    def __init__(self, index_config, directory, index=None, next_id=0, source_dir=None, model_name=EMBED_MODEL, batch_size=EMBED_BATCH_SIZE):
+        self.index_config = index_config
+        self.directory = directory
+        self.index = index
+        self.next_id = next_id
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.added = 0
+        self.cache = EmbeddingCache(model_name, EMBED_CACHE_DIR) if EMBED_CACHE_DIR else None
+        # The model (and worker pool) is only loaded once some chunk actually misses the cache
+        self.encoder = ChunkEncoder(model_name)
+        self._batch = []  # (chunk_id, url, text)
+        self._untrained = []  # (ids, embeddings) held back until an IVF index can be trained
+        self.store = ChunkStoreWriter(directory, keep_existing=source_dir is not None, source_directory=source_dir)
+
+    def add_page(self, url, chunks):
+        """Queue a page's chunks for embedding; returns the ids assigned to them."""
+        ids = []
+        for chunk in chunks:
+            self._batch.append((self.next_id, url, chunk))
+            ids.append(self.next_id)
+            self.next_id += 1
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+        return ids
+
+    def _embed(self, texts):
+        if self.cache is not None:
+            return self.cache.encode(list(texts), self.encoder.encode)
+        return np.asarray(self.encoder.encode(texts), dtype="float32")
+
+    def _add(self, ids, embeddings):
+        ids = np.asarray(ids, dtype="int64")
+        embeddings = prepare_vectors(embeddings, self.index_config)
+        if self.index is None:
+            if not training_size(self.index_config):
+                self.index, self.index_config = make_index(embeddings.shape[1], self.index_config)
+            else:
+                self._untrained.append((ids, embeddings))
+                if sum(len(i) for i, _ in self._untrained) >= training_size(self.index_config):
+                    self._train()
+                return
+        self.index.add_with_ids(embeddings, ids)
+
+    def _train(self):
+        """Train the IVF index on the held-back vectors (bounded by training_size) and add them."""
+        if not self._untrained:
+            return
+        ids = np.concatenate([i for i, _ in self._untrained])
+        embeddings = np.vstack([e for _, e in self._untrained])
+        self._untrained = []
+        print(f"[INFO] Training {self.index_config['type']} index on {len(embeddings)} vectors...")
+        self.index, self.index_config = make_index(embeddings.shape[1], self.index_config, embeddings)
+        self.index.add_with_ids(embeddings, ids)
+
+    def flush(self):
+        if not self._batch:
+            return
+        ids, _, texts = zip(*self._batch)
+        self._add(ids, self._embed(texts))
+        self.store.append(self._batch)
+        self.added += len(self._batch)
+        print(f"[INFO] Indexed {self.added} new chunks")
+        self._batch = []
+
+    def finish(self, removed_ids):
+        """Flush the last batch, drop `removed_ids` and write the merged chunk store to temp files.
+
+        Returns (temp, final) path pairs for the new chunk store (None if
+        nothing changed); `save_store` moves them into place.
+        """
+        self.flush()
+        self.encoder.close()
+        if self.cache is not None and self.cache.hits + self.cache.misses:
+            print(
+                f"[INFO] Embedding cache: {self.cache.hits} hits, {self.cache.misses} misses "
+                f"({self.cache.hit_ratio:.1%} hit ratio, {len(self.cache)} cached vectors)"
+            )
+        removed = set(removed_ids)
+        if not self.added and not removed:
+            self.store.discard()
+            return None
+        self._train()
+        store_files = self.store.finish(removed)
+        if removed and self.index is not None:
+            try:
+                self.index.remove_ids(np.array(sorted(removed), dtype="int64"))
+            except RuntimeError:
+                # HNSW graphs can't delete nodes: rebuild from the merged store (vectors come from the cache)
+                print(f"[INFO] {self.index_config['type']} index does not support removal, rebuilding it")
+                self._rebuild(store_files)
+        return store_files
+
+    def _rebuild(self, store_files):
+        self.index = None
+        tmp_paths = {os.path.basename(path): tmp_path for tmp_path, path in store_files}
+        batch = []
+        for chunk_id, _, text in iter_chunks(self.directory, tmp_paths):
+            batch.append((chunk_id, text))
+            if len(batch) >= self.batch_size:
+                ids, texts = zip(*batch)
+                self._add(ids, self._embed(texts))
+                batch = []
+        if batch:
+            ids, texts = zip(*batch)
+            self._add(ids, self._embed(texts))
+        self._train()
+        self.encoder.close()
+
+
+def link_version(source_dir, directory):
+    """Fill a new version directory with the files of a published build, hard-linked where possible.
+
+    Published versions are never modified in place, so sharing their inodes is safe.
+    """
+    names = [INDEX_NAME, INDEX_CONFIG_NAME, MANIFEST_NAME] + [os.path.basename(p) for p in store_paths(source_dir)]
+    for name in names:
+        try:
+            os.link(os.path.join(source_dir, name), os.path.join(directory, name))
+        except OSError:
+            shutil.copy2(os.path.join(source_dir, name), os.path.join(directory, name))
+
+
+def save_store(manifest, index, index_config, store_files, shard, directory):
+    """Complete the shard's new version in `directory` and publish it."""
+    # write_index streams to disk; serializing to bytes first would double the index in memory
+    faiss.write_index(index, os.path.join(directory, INDEX_NAME))
+    with open(os.path.join(directory, INDEX_CONFIG_NAME), "w", encoding="utf-8") as f:
+        json.dump(index_config, f, indent=1)
+    for tmp_path, path in store_files:
+        os.replace(tmp_path, path)
+    with open(os.path.join(directory, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    # Only now does any reader see the new version; until here CURRENT still names the old one
+    publish_version(shard, directory)
+
+def open_sources(specs, base_url=BASE_URL):
+    """Resolve source specs into (page keys, iterator of (key, text)).
+
+    web            crawl the reference pages under `base_url`
+    sphinx:DIR     a local Sphinx HTML build, keyed as if served from `base_url`
+    tar:FILE       a tarball of one (.tar, .tar.gz, ...), keyed the same way
+    package:NAME   docstrings and signatures of an installed package, e.g. manim or manimlib
+    files:DIR      docs, text and source files under DIR, e.g. example scenes or saved generations
+
+    Offline sources need no network, and sorted inputs make their builds reproducible.
+    """
+    keys, iterators = [], []
+    for spec in specs:
+        kind, _, arg = spec.partition(":")
+        if kind == "web":
+            print("[INFO] Fetching documentation links...")
+            session = make_session()
+            limiter = HostRateLimiter()
+            links = fetch_doc_links(session, base_url=base_url, limiter=limiter)
+            keys.extend(links)
+            iterators.append(crawl_pages(links, session=session, limiter=limiter))
+        elif kind in ("sphinx", "tar", "package", "files") and arg:
+            source = {"sphinx": sphinx_dir_pages, "tar": tarball_pages, "package": package_pages, "files": file_pages}[kind]
+            source_keys, pages = source(*((arg,) if kind in ("package", "files") else (arg, base_url)))
+            print(f"[INFO] {spec}: {len(source_keys)} pages, parsing with {SOURCE_WORKERS} worker processes")
+            keys.extend(source_keys)
+            iterators.append(pages)
+        else:
+            raise ValueError(f"Unknown source {spec!r}, expected web, sphinx:DIR, tar:FILE, package:NAME or files:DIR")
+    if len(set(keys)) != len(keys):
+        raise ValueError("Sources produce overlapping page keys")
+    return keys, itertools.chain.from_iterable(iterators)
 
 # 🔧 Main process
-def main():
-    print("[INFO] Fetching documentation links...")
-    links = fetch_doc_links()
-    all_chunks = []
-    all_metadata = []
+def main(full_rebuild=False, index_config=None, sources=("web",), base_url=BASE_URL, shard=DEFAULT_SHARD):
+    index_config = index_config or make_index_config()
+    source_dir = current_version_dir(shard)
+    store = load_store(index_config, source_dir) if source_dir and not full_rebuild else None
+    if store:
+        manifest, index = store
+        # Keep the clamped build params of the existing index, but take the requested search params
+        with open(os.path.join(source_dir, INDEX_CONFIG_NAME), "r", encoding="utf-8") as f:
+            stored_config = json.load(f)
+        stored_config["params"].update({k: index_config["params"][k] for k in SEARCH_PARAMS})
+        index_config = stored_config
+    else:
+        manifest = {"settings": _manifest_settings(index_config), "next_id": 0, "pages": {}}
+        index = None
+    pages = manifest["pages"]
+
+    links, source_pages = open_sources(sources, base_url)
+    if not links:
+        print("[ERROR] No documentation pages found, leaving the existing index untouched.")
+        return
+
+    version_dir = new_version_dir(shard)
+    builder = StreamingIndexBuilder(
+        index_config, version_dir, index, manifest["next_id"], source_dir=source_dir if store else None
+    )
+    # Dedupes within each page only: a page's chunks then depend on nothing but its own text,
+    # so an incremental build gives the same index as a full one
+    deduper = MinHashDeduper(DEDUPE_THRESHOLD) if DEDUPE_THRESHOLD else None
+    removed_ids = []
+    counts = {"unchanged": 0, "changed": 0, "new": 0, "deleted": 0, "failed": 0}
 
     print(f"[INFO] Found {len(links)} pages. Processing...")
-    for link in links:
-        text = fetch_and_clean(link)
+    crawl_start = time.perf_counter()
+    # Pages flow fetch -> clean -> chunk -> embed batch -> index; nothing accumulates per page
+    for link, text in source_pages:
         if not text:
+            # Keep whatever we indexed last time rather than dropping a page on a transient failure
             print(f"[DEBUG] No text fetched for {link}")
+            counts["failed"] += 1
             continue
-        print(f"[DEBUG] Text length for {link}: {len(text)}")
-        print(f"[DEBUG] Sample text: {text[:200]!r}")
-        chunks = chunk_text(text)
-        print(f"[DEBUG] Number of chunks for {link}: {len(chunks)}")
-        all_chunks.extend(chunks)
-        all_metadata.extend([link] * len(chunks))
+        digest = page_hash(text)
+        entry = pages.get(link)
+        if entry and entry["hash"] == digest:
+            counts["unchanged"] += 1
+            continue
+        counts["changed" if entry else "new"] += 1
+        if entry:
+            removed_ids.extend(entry["chunk_ids"])
+        page_chunks = [c for c in chunk_text(text, CHUNK_TOKENS) if c.strip()]
+        if deduper:
+            deduper.reset()
+            page_chunks = deduper.filter(page_chunks)
+        print(f"[DEBUG] Number of chunks for {link}: {len(page_chunks)}")
+        pages[link] = {"hash": digest, "chunk_ids": builder.add_page(link, page_chunks)}
+    crawl_time = time.perf_counter() - crawl_start
+    print(f"[INFO] Processed {len(links)} pages in {crawl_time:.1f}s ({len(links) / max(crawl_time, 1e-9):.1f} pages/s)")
+
+    live_links = set(links)
+    for link in [url for url in pages if url not in live_links]:
+        removed_ids.extend(pages.pop(link)["chunk_ids"])
+        counts["deleted"] += 1
 
-    build_faiss_index(all_chunks, all_metadata)
+    print("[INFO] Pages: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+    if deduper:
+        print(f"[INFO] Dropped {deduper.dropped} near-duplicate chunks")
+    store_files = builder.finish(removed_ids)
+    if store_files is None:
+        if store and not lexical_exists(source_dir):
+            # Readers may have the live version mapped: publish a copy with the lexical index added instead
+            link_version(source_dir, version_dir)
+            for tmp_path, path in write_lexical_index(iter_chunks(version_dir), version_dir):
+                os.replace(tmp_path, path)
+            publish_version(shard, version_dir)
+            print(f"[DONE] Index is up to date; built the missing lexical index into {version_dir}")
+            return
+        shutil.rmtree(version_dir)
+        print("[DONE] Index is up to date, nothing to re-embed.")
+        return
+    if builder.index is None or builder.index.ntotal == 0:
+        shutil.rmtree(version_dir)
+        print("[ERROR] No non-empty chunks to index.")
+        return
+    tmp_paths = {os.path.basename(path): tmp_path for tmp_path, path in store_files}
+    store_files += write_lexical_index(iter_chunks(version_dir, tmp_paths), version_dir)
+    manifest["next_id"] = builder.next_id
+    save_store(manifest, builder.index, builder.index_config, store_files, shard, version_dir)
+    print(f"[DONE] Added {builder.added} and removed {len(removed_ids)} chunks; {builder.index.ntotal} chunks saved to {version_dir}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build or incrementally update the Manim docs RAG index")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and rebuild everything")
+    parser.add_argument(
+        "--source", action="append", metavar="SPEC",
+        help="web (default), sphinx:DIR, tar:FILE, package:NAME or files:DIR; may be repeated",
+    )
+    parser.add_argument(
+        "--shard", choices=SHARDS, default=DEFAULT_SHARD,
+        help="Shard to build from the given sources, e.g. --shard manimlib --source package:manimlib --source files:DIR",
+    )
+    parser.add_argument("--base-url", default=BASE_URL, help="URL prefix for web and Sphinx/tarball page keys")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument(
+        "--index-param", action="append", default=[], metavar="NAME=VALUE",
+        help=f"Override an index parameter ({', '.join(INDEX_PARAMS)}); may be repeated",
+    )
+    args = parser.parse_args()
+    overrides = {}
+    for item in args.index_param:
+        name, _, value = item.partition("=")
+        if name not in INDEX_PARAMS:
+            parser.error(f"unknown index parameter {name!r}")
+        overrides[name] = type(INDEX_PARAMS[name])(value)
+    main(
+        full_rebuild=args.full,
+        index_config=make_index_config(args.index_type, overrides),
+        sources=args.source or ["web"],
+        base_url=args.base_url,
+        shard=args.shard,
+    )
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The indexing pipeline lives in the project root, the retriever and Gemini client in the app's src
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "manim-gemini-infographic", "src"))
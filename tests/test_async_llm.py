@@ -0,0 +1,26 @@
+import asyncio
+import time
+
+import pytest
+
+from async_llm import TokenBucket
+
+
+@pytest.mark.parametrize("rate", [0.5, 1, 2, 10])
+def test_token_bucket_never_exceeds_small_rates(rate):
+    period = 0.4
+
+    async def admit_times():
+        bucket = TokenBucket(rate, period)
+        start = time.monotonic()
+        times = []
+        for _ in range(3):
+            await bucket.acquire(1)
+            times.append(time.monotonic() - start)
+        return times
+
+    times = asyncio.run(admit_times())
+    allowed = max(1, int(rate))
+    for i, t in enumerate(times):
+        in_window = [u for u in times[:i + 1] if u > t - period]
+        assert len(in_window) <= allowed
@@ -0,0 +1,148 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import gemini_client
+from gemini_client import FenceStripper, strip_fences
+
+REPLIES = [
+    "```python\nfrom manim import *\n\nclass Scene1(Scene):\n    def construct(self):\n        pass\n```",
+    "  ```html\n<svg width=\"800\"></svg>\n```  \n",
+    "```\nplain fence\n```",
+    "no fence at all\n",
+    "x = `a` + ``` inside\n```",
+    "``",
+    "",
+]
+
+
+@pytest.mark.parametrize("reply", REPLIES)
+def test_fence_stripper_matches_strip_fences_on_random_splits(reply):
+    rng = random.Random(reply)
+    for _ in range(50):
+        cuts = sorted(rng.sample(range(len(reply) + 1), min(len(reply) + 1, rng.randint(0, 6))))
+        chunks = [reply[a:b] for a, b in zip([0] + cuts, cuts + [len(reply)])]
+        stripper = FenceStripper()
+        streamed = "".join(stripper.feed(chunk) for chunk in chunks) + stripper.finish()
+        assert streamed == strip_fences(reply)
+
+
+class _FakeModel:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if not stream:
+            return SimpleNamespace(text=self.reply)
+        return iter([SimpleNamespace(text=self.reply[i:i + 7]) for i in range(0, len(self.reply), 7)])
+
+
+@pytest.fixture
+def fake_model(tmp_path, monkeypatch):
+    model = _FakeModel(REPLIES[0])
+    monkeypatch.setattr(gemini_client, "_cache", gemini_client.ResponseCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(gemini_client, "get_model", lambda *args: model)
+    monkeypatch.setattr(gemini_client, "CACHE_MODE", "on")
+    return model
+
+
+def test_cached_streamed_reply_is_written_to_out_path(fake_model, tmp_path):
+    out_path = tmp_path / "scene.py"
+    first = gemini_client.generate("draw a circle", stream=True, out_path=str(out_path))
+    assert out_path.read_text() == first == strip_fences(REPLIES[0])
+    out_path.unlink()
+    second = gemini_client.generate("draw a circle", stream=True, out_path=str(out_path))
+    assert fake_model.calls == 1
+    assert out_path.read_text() == second == first
+
+
+@pytest.mark.parametrize("code", [
+    "x = 1 + \\\n",
+    "def f():\n    return 1 + \\\n",
+    "x = 1 + \\\n    2 + \\\n",
+    "x = (1 +\n",
+    "class Scene1(Scene):\n",
+])
+def test_python_syntax_error_accepts_incomplete_prefixes(code):
+    assert gemini_client.python_syntax_error(code) is None
+
+
+@pytest.mark.parametrize("code", ["x = )\n", "x = )\ny = 1 + \\\n", "def f(:\n"])
+def test_python_syntax_error_reports_broken_prefixes(code):
+    assert gemini_client.python_syntax_error(code)
+
+
+def test_stream_check_is_not_fooled_by_a_continuation_line(fake_model, tmp_path):
+    # The tenth line, where the first check runs, ends in a backslash continuation
+    code = "".join(f"a{n} = {n}\n" for n in range(9)) + "total = a0 + \\\n    a1\n"
+    fake_model.reply = f"```python\n{code}```"
+    out_path = tmp_path / "scene.py"
+    text = gemini_client.generate("sum", stream=True, out_path=str(out_path), check=gemini_client.python_syntax_error)
+    assert text == code.strip()
+    assert out_path.read_text() == text
+
+
+def test_stream_check_aborts_broken_code(fake_model, tmp_path):
+    code = "x = )\n" + "".join(f"a{n} = {n}\n" for n in range(20))
+    fake_model.reply = f"```python\n{code}```"
+    out_path = tmp_path / "scene.py"
+    text = gemini_client.generate("sum", stream=True, out_path=str(out_path), check=gemini_client.python_syntax_error)
+    assert text.startswith("x = )\n") and len(text) < len(code)
+    assert gemini_client._cache.get(gemini_client.ResponseCache.key(gemini_client.DEFAULT_MODEL, None, "sum")) is None
+
+
+def test_repair_prompts_bypass_the_cache_but_are_recorded_for_replay(fake_model, monkeypatch):
+    gemini_client.generate("fix this", stream=False, cache=False)
+    gemini_client.generate("fix this", stream=False, cache=False)
+    assert fake_model.calls == 2
+    monkeypatch.setattr(gemini_client, "CACHE_MODE", "replay")
+    assert gemini_client.generate("fix this", stream=False, cache=False) == strip_fences(REPLIES[0])
+    assert fake_model.calls == 2
+
+
+def test_rejected_replies_are_not_served_again(fake_model):
+    fake_model.reply = "Sure! Here are the elements: title, chart"
+    for _ in range(2):
+        assert gemini_client.generate("list elements", stream=False, validate=gemini_client.is_json_list) == fake_model.reply
+    assert fake_model.calls == 2
+    fake_model.reply = '["title", "chart"]'
+    gemini_client.generate("list elements", stream=False, validate=gemini_client.is_json_list)
+    gemini_client.generate("list elements", stream=False, validate=gemini_client.is_json_list)
+    assert fake_model.calls == 3
+
+
+def test_invalid_structured_replies_are_not_served_again(fake_model):
+    fake_model.reply = '{"elements": [], "code": ""'
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            gemini_client.generate_json("plan", {"type": "OBJECT"})
+    assert fake_model.calls == 2
+    fake_model.reply = '{"elements": [], "code": ""}'
+    assert gemini_client.generate_json("plan", {"type": "OBJECT"}, validate=lambda plan: plan["elements"]) == {"elements": [], "code": ""}
+    gemini_client.generate_json("plan", {"type": "OBJECT"}, validate=lambda plan: plan["elements"])
+    assert fake_model.calls == 4
+
+
+def test_a_cached_reply_rejected_later_is_dropped(fake_model):
+    fake_model.reply = "not a list"
+    gemini_client.generate("list elements", stream=False)
+    gemini_client.generate("list elements", stream=False, validate=gemini_client.is_json_list)
+    assert fake_model.calls == 1
+    gemini_client.generate("list elements", stream=False, validate=gemini_client.is_json_list)
+    assert fake_model.calls == 2
+
+
+def test_a_read_only_cache_still_serves_hits(fake_model, monkeypatch):
+    gemini_client.generate("draw a circle", stream=False)
+
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(gemini_client.os, "utime", read_only)
+    assert gemini_client.generate("draw a circle", stream=False) == strip_fences(REPLIES[0])
+    monkeypatch.setattr(gemini_client, "CACHE_MODE", "replay")
+    assert gemini_client.generate("draw a circle", stream=False) == strip_fences(REPLIES[0])
+    assert fake_model.calls == 1
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+import rag_setup
+from chunk_store import iter_chunks
+from lexical_index import lexical_exists, lexical_paths
+
+DIM = 16
+
+
+def stub_encode(self, texts):
+    """Deterministic unit vectors from a hash of each text, in place of the sentence-transformers model."""
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(DIM).astype("float32")
+        vectors.append(vector / np.linalg.norm(vector))
+    return np.vstack(vectors)
+
+
+def page(name, paragraphs=4):
+    return "\n\n".join(f"{name} paragraph {n}: " + " ".join(f"{name}word{n}x{i}" for i in range(30)) for n in range(paragraphs))
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_setup, "OUTPUT_DIR", str(tmp_path / "db"))
+    monkeypatch.setattr(rag_setup, "SHARDS_DIR", str(tmp_path / "db" / "shards"))
+    monkeypatch.setattr(rag_setup, "EMBED_CACHE_DIR", "")
+    monkeypatch.setattr(rag_setup, "CHUNK_TOKENS", 40)
+    monkeypatch.setattr(rag_setup.ChunkEncoder, "encode", stub_encode)
+
+    def run(pages, full_rebuild=False, shard="manim_ce", index_type="flat"):
+        monkeypatch.setattr(rag_setup, "open_sources", lambda specs, base_url: (list(pages), iter(pages.items())))
+        rag_setup.main(full_rebuild=full_rebuild, index_config=rag_setup.make_index_config(index_type), shard=shard)
+        directory = rag_setup.current_version_dir(shard)
+        with open(os.path.join(directory, rag_setup.MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        index = faiss.read_index(os.path.join(directory, rag_setup.INDEX_NAME))
+        return directory, manifest, index, list(iter_chunks(directory))
+
+    return run
+
+
+def assert_index_matches_store(index, chunks):
+    ids = sorted(chunk_id for chunk_id, _, _ in chunks)
+    assert sorted(faiss.vector_to_array(index.id_map).tolist()) == ids
+    vectors = stub_encode(None, [text for _, _, text in chunks])
+    _, found = index.search(vectors, 1)
+    assert found[:, 0].tolist() == [chunk_id for chunk_id, _, _ in chunks]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])  # HNSW can't remove ids and is rebuilt from the store
+def test_incremental_build_matches_full_rebuild(build, index_type):
+    pages = {"a": page("alpha"), "b": page("beta"), "c": page("gamma")}
+    first_dir, manifest, index, chunks = build(pages, index_type=index_type)
+    assert_index_matches_store(index, chunks)
+    assert sorted(manifest["pages"]) == ["a", "b", "c"]
+    unchanged_ids = manifest["pages"]["a"]["chunk_ids"]
+
+    # Change b, delete c, add d
+    updated = {"a": page("alpha"), "b": page("beta", 6), "d": page("delta", 2)}
+    second_dir, manifest, index, chunks = build(updated, index_type=index_type)
+    assert second_dir != first_dir
+    assert_index_matches_store(index, chunks)
+    assert manifest["pages"]["a"]["chunk_ids"] == unchanged_ids
+    assert sorted(manifest["pages"]) == ["a", "b", "d"]
+    for url, entry in manifest["pages"].items():
+        assert sorted(i for i, chunk_url, _ in chunks if chunk_url == url) == entry["chunk_ids"]
+
+    _, _, full_index, full_chunks = build(updated, full_rebuild=True, shard="generations", index_type=index_type)
+    assert sorted((url, text) for _, url, text in chunks) == sorted((url, text) for _, url, text in full_chunks)
+    assert index.ntotal == full_index.ntotal
+
+
+def test_unchanged_pages_publish_no_new_version(build):
+    pages = {"a": page("alpha"), "b": page("beta")}
+    first_dir, _, _, chunks = build(pages)
+    second_dir, _, _, same_chunks = build(pages)
+    assert second_dir == first_dir
+    assert same_chunks == chunks
+
+
+def test_every_page_removed_but_one(build):
+    build({"a": page("alpha"), "b": page("beta"), "c": page("gamma")})
+    _, manifest, index, chunks = build({"b": page("beta")})
+    assert {url for _, url, _ in chunks} == {"b"}
+    assert_index_matches_store(index, chunks)
+    assert list(manifest["pages"]) == ["b"]
+
+
+def test_a_missing_lexical_index_is_added_to_a_new_version(build):
+    pages = {"a": page("alpha"), "b": page("beta")}
+    first_dir, _, _, chunks = build(pages)
+    for path in lexical_paths(first_dir):
+        os.remove(path)
+    published = sorted(os.listdir(first_dir))
+    second_dir, _, _, same_chunks = build(pages)
+    assert second_dir != first_dir
+    assert sorted(os.listdir(first_dir)) == published
+    assert lexical_exists(second_dir)
+    assert same_chunks == chunks
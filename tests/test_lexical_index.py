@@ -0,0 +1,58 @@
+import json
+import math
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import BM25_B, BM25_K1, POSTING_DTYPE, lexical_paths, tokenize, write_lexical_index
+
+CORPUS = [
+    "Create a Circle and a Square, then VGroup(circle, square).arrange(RIGHT)",
+    "axes = Axes(); graph = axes.plot(lambda x: x ** 2); axes.get_riemann_rectangles(graph)",
+    "MathTex(r'e^{i\\\\pi} + 1 = 0') renders LaTeX; Tex renders text mode",
+    "self.play(Create(circle)); self.wait()",
+    "",
+    "circle circle circle square",
+    "d3.select('svg').append('circle').attr('r', 10)",
+]
+
+
+def brute_force_bm25(docs):
+    """{term: {chunk id: weight}} straight from the BM25 formula."""
+    counts = {chunk_id: Counter(tokenize(text)) for chunk_id, text in docs}
+    lengths = {chunk_id: sum(c.values()) for chunk_id, c in counts.items()}
+    avgdl = sum(lengths.values()) / len(docs)
+    weights = {}
+    for term in {t for c in counts.values() for t in c}:
+        holders = [chunk_id for chunk_id, c in counts.items() if term in c]
+        idf = math.log(1 + (len(docs) - len(holders) + 0.5) / (len(holders) + 0.5))
+        weights[term] = {}
+        for chunk_id in holders:
+            tf = counts[chunk_id][term]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[chunk_id] / avgdl)
+            weights[term][chunk_id] = idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return weights
+
+
+@pytest.mark.parametrize("spill_postings", [1, 7, 1000000])
+def test_postings_match_brute_force_bm25(tmp_path, spill_postings):
+    # Ids out of order and with gaps, as after incremental builds
+    docs = [(chunk_id, text) for chunk_id, text in zip([40, 3, 17, 8, 99, 5, 21], CORPUS)]
+    for tmp, final in write_lexical_index(((i, "url", t) for i, t in docs), str(tmp_path), spill_postings):
+        os.replace(tmp, final)
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in lexical_paths(str(tmp_path)))
+
+    terms_path, postings_path = lexical_paths(str(tmp_path))
+    with open(terms_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    postings = np.fromfile(postings_path, dtype=POSTING_DTYPE)
+    expected = brute_force_bm25(docs)
+    assert meta["num_docs"] == len(docs)
+    assert list(meta["terms"]) == sorted(expected)
+    assert sum(count for _, count in meta["terms"].values()) == len(postings)
+    for term, (offset, count) in meta["terms"].items():
+        rows = postings[offset:offset + count]
+        assert rows["id"].tolist() == sorted(expected[term])
+        assert np.allclose(rows["weight"], [expected[term][i] for i in rows["id"]], rtol=1e-6)
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from rag_retriever import _is_symbol_query, _tokenize
+
+LEXICON = set(_tokenize(
+    "Create a Circle Animate text Draw Plot the function VGroup arrange MathTex Axes get_graph "
+    "Scene construct self play"
+))
+
+
+@pytest.mark.parametrize("query", [
+    "VGroup arrange",
+    "MathTex",
+    "Axes get_graph",
+    "Scene.construct",
+    "self.play()",
+])
+def test_identifier_queries_take_the_lexical_path(query):
+    assert _is_symbol_query(query, LEXICON)
+
+
+@pytest.mark.parametrize("query", [
+    "Create a Circle",
+    "Animate text",
+    "Draw a Circle",
+    "Plot the function",
+    "Circle",
+    "arrange",
+])
+def test_prose_goes_to_dense_search(query):
+    assert not _is_symbol_query(query, LEXICON)
+
+
+def test_unknown_terms_go_to_dense_search():
+    assert not _is_symbol_query("VGroup frobnicate_widget", LEXICON)
+
+
+def test_long_queries_are_not_lookups():
+    assert not _is_symbol_query("VGroup arrange MathTex Axes get_graph", LEXICON)
+
+
+class _Lexical:
+    def __init__(self, terms, hits):
+        self.terms = set(terms)
+        self.hits = hits
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def search(self, terms, top_k):
+        return self.hits[:top_k]
+
+
+class _Store:
+    def __init__(self, shard, ids):
+        self.chunks = {i: (f"{shard} chunk {i}", f"{shard}://{i}") for i in ids}
+
+    def get(self, chunk_id):
+        return self.chunks.get(chunk_id)
+
+
+class _Version:
+    def __init__(self, name, hits):
+        self.name = name
+        self.lexical = _Lexical(_tokenize("VGroup arrange"), hits)
+        self.store = _Store(name.split("/")[0], [i for i, _ in hits])
+
+
+def test_symbol_lookups_merge_shards_by_rank_not_raw_bm25(monkeypatch):
+    import rag_retriever
+
+    # A small corpus gives much larger BM25 scores than a big one for the same terms
+    big = _Version("manim_ce/v1", [(1, 4.0), (2, 3.5), (3, 3.0)])
+    small = _Version("manimlib/v1", [(7, 40.0), (8, 35.0), (9, 30.0)])
+    monkeypatch.setattr(rag_retriever, "_load_versions", lambda shards: [("manim_ce", big), ("manimlib", small)])
+    monkeypatch.setattr(rag_retriever, "RETRIEVAL_MODE", "auto")
+    hits = rag_retriever.retrieve_relevant_docs_batch(["VGroup arrange"], top_k=4, shards=["manim_ce", "manimlib"])[0]
+    urls = [url for _, url, _ in hits]
+    assert urls == ["manim_ce://1", "manimlib://7", "manim_ce://2", "manimlib://8"]
+
+
+def test_reads_the_formats_rag_setup_writes():
+    import chunk_store
+    import lexical_index
+    import rag_retriever
+
+    assert rag_retriever.RECORD_DTYPE == chunk_store.RECORD_DTYPE
+    assert rag_retriever.POSTING_DTYPE == lexical_index.POSTING_DTYPE
+    assert rag_retriever._tokenize is lexical_index.tokenize
+
+
+def test_a_publish_within_the_timestamp_resolution_is_still_seen(tmp_path, monkeypatch):
+    import rag_retriever
+
+    monkeypatch.setattr(rag_retriever, "SHARDS_DIR", str(tmp_path))
+    shard = rag_retriever._Shard("manim_ce")
+    os.makedirs(shard.root)
+    current = os.path.join(shard.root, "CURRENT")
+    with open(current, "w") as f:
+        f.write("v000001\n")
+    before = shard._stat_current()
+    # Same-length name, same mtime: only the rename tells the versions apart
+    with open(current + ".tmp", "w") as f:
+        f.write("v000002\n")
+    os.utime(current + ".tmp", ns=(os.stat(current).st_atime_ns, os.stat(current).st_mtime_ns))
+    os.replace(current + ".tmp", current)
+    assert shard._stat_current() != before
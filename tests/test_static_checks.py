@@ -0,0 +1,127 @@
+import pytest
+
+import static_checks
+
+CLEAN_SCENE = '''from manim import *
+import numpy as np
+
+
+class Scene(Scene):
+    def construct(self):
+        title = Title("Photosynthesis")
+        label = Text("Light", font_size=28).to_edge(LEFT)
+        formula = MathTex(r"6CO_2 + 6H_2O \\to C_6H_{12}O_6 + 6O_2")
+        formula.next_to(label, RIGHT)
+        arrow = Arrow(LEFT, RIGHT).move_to(2 * DOWN)
+        self.add(title, label, formula, arrow)
+'''
+
+CLEAN_PAGE = """<!DOCTYPE html>
+<html><body>
+<script src="https://d3js.org/d3.v7.min.js"></script>
+<script>
+const width = 800, height = 600;
+const svg = d3.select("body").append("svg").attr("width", width).attr("height", height);
+svg.append("text").attr("x", 40).attr("y", 40).text("Title");
+svg.append("text").attr("x", 40).attr("y", 80).text("Subtitle");
+svg.append("circle").attr("cx", 400).attr("cy", 300).attr("r", 50);
+</script>
+</body></html>
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_stats_file(monkeypatch):
+    monkeypatch.setattr(static_checks, "REVIEW_STATS_FILE", "")
+
+
+@pytest.fixture(params=["node", "scan"])
+def js_checker(request, monkeypatch):
+    """Run the D3 syntax checks with `node --check` when it is installed, and with the fallback scan."""
+    if request.param == "scan":
+        monkeypatch.setattr(static_checks.shutil, "which", lambda name: None)
+    elif static_checks.shutil.which("node") is None:
+        pytest.skip("node is not installed")
+
+
+def test_clean_scene_needs_no_review():
+    assert static_checks.manim_syntax_issues(CLEAN_SCENE) == []
+    assert static_checks.manim_layout_issues(CLEAN_SCENE) == []
+
+
+def test_syntax_errors_and_missing_scene():
+    assert static_checks.manim_syntax_issues("class Scene(Scene:\n    pass\n")[0].startswith("SyntaxError")
+    assert static_checks.manim_syntax_issues("from manim import *\n\nclass Intro(Scene):\n    def construct(self):\n        pass\n") == [
+        "no top-level class named 'Scene'"
+    ]
+    assert static_checks.manim_syntax_issues("class Scene:\n    pass\n") == ["class Scene has no construct() method"]
+
+
+def test_imports_are_judged_without_looking_at_the_environment():
+    code = CLEAN_SCENE.replace("import numpy as np", "import numpy as np\nimport os\nfrom PIL import Image")
+    assert static_checks.manim_syntax_issues(code) == []
+    issues = static_checks.manim_syntax_issues(CLEAN_SCENE.replace("import numpy as np", "from manimlib import *\nimport my_helpers"))
+    assert len(issues) == 2
+    assert "manimlib" in issues[0] and "my_helpers" in issues[1]
+
+
+def test_legacy_api_names_are_flagged():
+    code = CLEAN_SCENE.replace('Text("Light", font_size=28)', 'TextMobject("Light")') + "        self.play(ShowCreation(arrow))\n"
+    issues = static_checks.manim_syntax_issues(code)
+    assert [issue.split(",")[0] for issue in issues] == ["uses ShowCreation", "uses TextMobject"]
+    # A helper the scene defines itself is not the old API
+    assert static_checks.manim_syntax_issues(CLEAN_SCENE + "\n\ndef ShowCreation(mobject):\n    return Create(mobject)\n") == []
+
+
+def test_unpositioned_text_overlaps_at_origin():
+    code = CLEAN_SCENE.replace("formula.next_to(label, RIGHT)", 'caption = Text("Chlorophyll absorbs light")')
+    assert static_checks.manim_layout_issues(code) == ["text mobjects caption, formula are never positioned, so they overlap at ORIGIN"]
+    arranged = code.replace("self.add(", "VGroup(formula, caption).arrange(DOWN)\n        self.add(")
+    assert static_checks.manim_layout_issues(arranged) == []
+
+
+def test_off_frame_and_overlong_text():
+    code = CLEAN_SCENE.replace("move_to(2 * DOWN)", "move_to([9, 0, 0])").replace('Text("Light", font_size=28)', f'Text("{"x" * 90}")')
+    issues = static_checks.manim_layout_issues(code)
+    assert any("90-character Text line" in issue for issue in issues)
+    assert any("move_to([9, 0, 0]) is outside the frame" in issue for issue in issues)
+
+
+def test_clean_d3_page_needs_no_review(js_checker):
+    assert static_checks.d3_syntax_issues(CLEAN_PAGE) == []
+    assert static_checks.d3_layout_issues(CLEAN_PAGE) == []
+
+
+@pytest.mark.parametrize("broken", [
+    'svg.append("circle").attr("cx", 400;',
+    'svg.append("text").text("unterminated);',
+    "if (true) {",
+])
+def test_d3_script_syntax_errors(js_checker, broken):
+    issues = static_checks.d3_syntax_issues(CLEAN_PAGE.replace("</script>\n</body>", broken + "\n</script>\n</body>"))
+    assert len(issues) == 1 and issues[0].startswith("script 1:")
+
+
+def test_d3_never_loaded_and_no_svg(js_checker):
+    page = CLEAN_PAGE.replace('<script src="https://d3js.org/d3.v7.min.js"></script>\n', "")
+    assert static_checks.d3_syntax_issues(page) == ["uses d3 but never loads it with a <script src=...>"]
+    assert static_checks.d3_syntax_issues("<html><body><p>hi</p></body></html>") == ["creates no <svg>"]
+
+
+def test_d3_overlapping_and_off_canvas_elements():
+    page = CLEAN_PAGE.replace('attr("y", 80)', 'attr("y", 40)').replace('attr("cx", 400)', 'attr("cx", 900)')
+    assert static_checks.d3_layout_issues(page) == [
+        "two text elements at (40, 40)",
+        "<circle> at (900, 300) is outside the 800x600 canvas",
+    ]
+
+
+@pytest.mark.parametrize("mode, issues, ran", [
+    ("auto", [], False),
+    ("auto", ["something"], True),
+    ("always", [], True),
+    ("never", ["something"], False),
+])
+def test_review_needed_follows_the_mode(monkeypatch, mode, issues, ran):
+    monkeypatch.setattr(static_checks, "REVIEW_MODE", mode)
+    assert static_checks.review_needed("syntax", issues) is ran